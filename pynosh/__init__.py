@@ -5,6 +5,7 @@ from . import modelevaluator_bordering_constant
 from . import numerical_methods
 from . import preconditioners
 from . import magnetic_vector_potentials
+from . import solution_library
 from . import yaml
 
 from .__about__ import (
@@ -26,5 +27,6 @@ __all__ = [
     "numerical_methods",
     "preconditioners",
     "magnetic_vector_potentials",
+    "solution_library",
     "yaml",
 ]
@@ -1,6 +1,15 @@
 """Module that provides magnetic vector potentials."""
+import functools
+import hashlib
+import inspect
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy
 
+from .__about__ import __version__
+
 
 def constant_field(X, B):
     """Converts a spatially constant magnetic field B at X
@@ -10,6 +19,17 @@ def constant_field(X, B):
     return 0.5 * numpy.cross(B, X)
 
 
+def constant_field_edge_integral(X0, X1, B):
+    """Line integrals of :func:`constant_field` along the straight edges from
+    X0[k] to X1[k],
+
+    .. math::
+        \\int_{X_0}^{X_1} A\\cdot dx
+            = \\frac{1}{2} B\\cdot (X_0\\times X_1).
+    """
+    return 0.5 * numpy.dot(numpy.cross(_pad(X0), _pad(X1)), B)
+
+
 def magnetic_dipole(x, x0, m):
     """Magnetic vector potential for the static dipole at x0 with orientation
     m.
@@ -22,7 +42,29 @@ def magnetic_dipole(x, x0, m):
     return (numpy.cross(m, r).T / numpy.sum(numpy.abs(r) ** 2, axis=-1) ** (3. / 2)).T
 
 
-def magnetic_dot(X, radius, heights):
+def magnetic_dipole_edge_integral(X0, X1, x0, m):
+    """Line integrals of :func:`magnetic_dipole` along the straight edges from
+    X0[k] to X1[k]. With r_i = X_i - x0, the integrand m.(r(t) x (r1-r0)) /
+    |r(t)|^3 has a constant numerator, and the integral is
+
+    .. math::
+        m\\cdot(r_0\\times r_1)
+        \\frac{|r_0| + |r_1|}{|r_0||r_1| (|r_0||r_1| + r_0\\cdot r_1)},
+
+    which is well-conditioned unless x0 is on the edge.
+    """
+    r0 = _pad(X0) - x0
+    r1 = _pad(X1) - x0
+    n0 = numpy.sqrt(numpy.sum(r0 ** 2, axis=1))
+    n1 = numpy.sqrt(numpy.sum(r1 ** 2, axis=1))
+    return (
+        numpy.dot(numpy.cross(r0, r1), m)
+        * (n0 + n1)
+        / (n0 * n1 * (n0 * n1 + numpy.sum(r0 * r1, axis=1)))
+    )
+
+
+def magnetic_dot(X, radius, heights, method="quadrature", num_workers=1):
     """Magnetic vector potential corresponding to the field that is induced by
     a cylindrical magnetic dot, centered at (0,0,0.5*(height0+height1)), with
     the radius `radius` for objects in the x-y-plane.  The potential is derived
@@ -31,7 +73,828 @@ def magnetic_dot(X, radius, heights):
 
        A(x) = \int_{dot} A_{dipole}(x-r) dr.
 
-    Support for input valued (x,y,z), z!=0, is pending.
+    `method` is one of
+
+      * "quadrature": The integral in z-direction is computed analytically,
+        the one over the disk with the midpoint rule on 100 x 32 segments.
+        Vectorized over blocks of nodes.
+      * "elliptic": The dot is equivalent to a stack of circular current
+        loops whose potential is given in terms of complete elliptic
+        integrals; the stack is integrated with Gauss-Legendre quadrature in
+        z. Vectorized over all nodes, and takes the z-coordinate of the
+        nodes (if any) into account.
+      * "loop": The original, unvectorized implementation of "quadrature",
+        kept for reference.
+
+    The vectorized methods are evaluated in chunks with :func:`evaluate` on
+    `num_workers` workers (None: all CPUs).
+
+    Except for "elliptic", support for input valued (x,y,z), z!=0, is
+    pending.
+    """
+    if method == "quadrature":
+        return evaluate(
+            _magnetic_dot_quadrature,
+            X,
+            args=(radius, heights),
+            chunk_size=_DOT_BLOCK_SIZE,
+            num_workers=num_workers,
+        )
+    elif method == "elliptic":
+        return evaluate(
+            _magnetic_dot_elliptic,
+            X,
+            args=(radius, heights),
+            chunk_size=_DOT_BLOCK_SIZE,
+            num_workers=num_workers,
+        )
+    elif method == "loop":
+        return _magnetic_dot_loop(X, radius, heights)
+    raise ValueError("Unknown method " "%s" "." % method)
+
+
+def evaluate(
+    potential,
+    X,
+    args=(),
+    chunk_size=4096,
+    num_workers=None,
+    executor="thread",
+    out=None,
+):
+    """Evaluates `potential(X[chunk], *args)` for chunks of `chunk_size`
+    nodes and writes the results into the preallocated array `out` of shape
+    (len(X), 3). Hence, the temporaries of `potential` are bounded by the
+    chunk size.
+
+    The chunks are distributed over `num_workers` workers (default: the
+    number of CPUs) of a thread pool (`executor="thread"`; numpy releases the
+    GIL in the heavy lifting) or a process pool (`executor="process"`;
+    `potential` must then be picklable, e.g., a module-level function).
+    Example::
+
+        A = evaluate(magnetic_dipole, X, args=(x0, m), num_workers=4)
+    """
+    n = len(X)
+    if out is None:
+        out = numpy.empty((n, 3))
+    assert out.shape == (n, 3)
+    chunks = [slice(k, min(k + chunk_size, n)) for k in range(0, n, chunk_size)]
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if num_workers == 1 or len(chunks) < 2:
+        for chunk in chunks:
+            _evaluate_chunk(potential, X, args, out, chunk)
+        return out
+
+    num_workers = min(num_workers, len(chunks))
+    if executor == "thread":
+        # The workers write straight into disjoint slices of out.
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            futures = [
+                pool.submit(_evaluate_chunk, potential, X, args, out, chunk)
+                for chunk in chunks
+            ]
+            for future in futures:
+                future.result()
+    elif executor == "process":
+        # Only the chunk of X goes to the worker, and only the chunk of the
+        # result comes back; results are streamed into out in order.
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            results = pool.map(_call, [(potential, X[chunk], args) for chunk in chunks])
+            for chunk, A in zip(chunks, results):
+                out[chunk] = A
+    else:
+        raise ValueError("Unknown executor " "%s" "." % executor)
+    return out
+
+
+def _evaluate_chunk(potential, X, args, out, chunk):
+    out[chunk] = potential(X[chunk], *args)
+    return
+
+
+def _call(task):
+    potential, X, args = task
+    return potential(X, *args)
+
+
+class Cache(object):
+    """On-disk memoization of potentials. Example::
+
+        cache = Cache()
+        A = cache(magnetic_dot, X, 2.0, [10.0, 11.0])
+
+    The result is keyed by the name of the potential, the node coordinates
+    and all other arguments (normalized, such that positional and keyword
+    arguments, defaults and :func:`functools.partial` objects give the same
+    key), and stored as a .npy file in `directory` (default:
+    $XDG_CACHE_HOME/pynosh or ~/.cache/pynosh). The potential is always
+    returned as a read-only memory map of that file. Files are written
+    atomically, so several processes can share the directory. If the files
+    exceed `max_size` bytes, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory=None, max_size=2 ** 30):
+        """Initialization.
+        """
+        if directory is None:
+            directory = os.path.join(
+                os.environ.get(
+                    "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+                ),
+                "pynosh",
+            )
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        return
+
+    def __call__(self, potential, X, *args, **kwargs):
+        filename = os.path.join(
+            self.directory, self.get_key(potential, X, *args, **kwargs) + ".npy"
+        )
+        try:
+            A = numpy.load(filename, mmap_mode="r")
+            # Mark as recently used.
+            os.utime(filename)
+            return A
+        except (FileNotFoundError, ValueError):
+            pass
+
+        A = numpy.asarray(potential(X, *args, **kwargs))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            numpy.save(f, A)
+        os.replace(tmp, filename)
+        # Map the file before it might be evicted.
+        A = numpy.load(filename, mmap_mode="r")
+        self._evict()
+        return A
+
+    def get_key(self, potential, X, *args, **kwargs):
+        """Returns the hash of the potential and its arguments.
+        """
+        potential, arguments = _bind(potential, (X,) + args, kwargs)
+        h = hashlib.sha1()
+        h.update(
+            "{}.{}-{}".format(
+                getattr(potential, "__module__", None),
+                getattr(potential, "__qualname__", type(potential).__qualname__),
+                __version__,
+            ).encode()
+        )
+        _update_hash(h, arguments)
+        return h.hexdigest()
+
+    def clear(self):
+        """Removes all cached potentials.
+        """
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                _remove(entry.path)
+        return
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".npy"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, file_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            _remove(path)
+            size -= file_size
+        return
+
+
+def _bind(potential, args, kwargs):
+    """Unwraps :func:`functools.partial` objects and returns the underlying
+    function along with all its arguments as a list of (name, value) pairs,
+    defaults included. If the signature can't be determined, the positional
+    and (sorted) keyword arguments are returned as they are.
+    """
+    while isinstance(potential, functools.partial):
+        args = potential.args + tuple(args)
+        kwargs = dict(potential.keywords, **kwargs)
+        potential = potential.func
+    try:
+        bound = inspect.signature(potential).bind(*args, **kwargs)
+    except (TypeError, ValueError):
+        return potential, [list(args), sorted(kwargs.items())]
+    bound.apply_defaults()
+    return potential, list(bound.arguments.items())
+
+
+def _update_hash(h, obj):
+    if isinstance(obj, numpy.generic):
+        # same as the corresponding Python scalar
+        obj = obj.item()
+    if isinstance(obj, dict):
+        # e.g., the **kwargs of a potential
+        obj = sorted(obj.items())
+    if isinstance(obj, numpy.ndarray):
+        obj = numpy.ascontiguousarray(obj)
+        h.update("array{}{}".format(obj.dtype.str, obj.shape).encode())
+        h.update(obj.tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update("sequence{}".format(len(obj)).encode())
+        for item in obj:
+            _update_hash(h, item)
+    else:
+        h.update(repr(obj).encode())
+    return
+
+
+def _remove(path):
+    # Another process might have been faster.
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return
+
+
+def dipoles(
+    X,
+    x0,
+    m,
+    theta=0.1,
+    order=6,
+    leaf_size=16,
+    box_size=32,
+    chunk_size=4096,
+    num_workers=1,
+):
+    """Superposition of the potentials of the dipoles at x0[j] with
+    orientations m[j], i.e., of :func:`magnetic_dipole` (X, x0[j], m[j]),
+    computed with a fast summation:
+
+      * The sources are sorted into a tree (at most `leaf_size` sources per
+        leaf), and each cell carries the multipole expansion of its
+        potential up to second order (monopole, dipole and quadrupole
+        moments of the moment distribution).
+      * The nodes are sorted into a tree of boxes (at most `box_size` nodes
+        per leaf), and each box carries `order` Chebyshev points per
+        dimension, from which its share of the potential is interpolated
+        to its nodes.
+      * The two trees are traversed together. A cell of radius rho and a
+        box of radius r at the distance d interact via the expansion of the
+        cell at the points of the box if rho < theta (d - r) (expansion) and
+        r < eta (d - rho) (interpolation) with eta = theta^(3/order).
+        Otherwise, the larger of the two is split. Sources in leaves are
+        summed exactly, at the points of the box if r < eta (d - extent),
+        and at its nodes if not. Boxes with fewer nodes than points get all
+        contributions at their nodes.
+
+    Both errors are of the order theta^3; as theta -> 0, the sum is exact.
+    The defaults give a relative error of about 1e-5 to 1e-4. Since far-away
+    sources only enter via the expansions of large cells, the cost grows
+    much slower than the number of sources. The nodes are processed in
+    chunks with :func:`evaluate`.
+    """
+    x0 = numpy.asarray(x0, dtype=float).reshape(-1, 3)
+    m = numpy.asarray(m, dtype=float).reshape(-1, 3)
+    tree = _SourceTree(
+        x0, numpy.zeros(len(x0)), numpy.zeros((len(x0), 3, 3)), m, leaf_size
+    )
+    return _fast_sum(
+        X,
+        (tree, _dipoles_direct, (x0, m), theta, order, box_size),
+        chunk_size,
+        num_workers,
+    )
+
+
+def dots(
+    X,
+    centers,
+    radii,
+    heights,
+    method="elliptic",
+    theta=0.1,
+    order=6,
+    leaf_size=16,
+    box_size=32,
+    chunk_size=4096,
+    num_workers=1,
+):
+    """Superposition of the potentials of the magnetic dots centered at
+    (centers[j], 0.5*(heights[j][0]+heights[j][1])) with the radii radii[j],
+    i.e., of :func:`magnetic_dot` (X - centers[j], radii[j], heights[j],
+    method).
+
+    Seen from far away, a dot is a distribution of dipoles with the total
+    moment -(volume of the dot) e_z, so the same fast summation as in
+    :func:`dipoles` applies; the extent of the dots is accounted for in the
+    radii of the cells and their expansions. Nodes close to a dot get its
+    exact potential.
+    """
+    centers = numpy.asarray(centers, dtype=float).reshape(-1, 2)
+    radii = numpy.asarray(radii, dtype=float).reshape(-1)
+    heights = numpy.asarray(heights, dtype=float).reshape(-1, 2)
+    half_height = 0.5 * (heights[:, 1] - heights[:, 0])
+    positions = numpy.column_stack([centers, heights.mean(axis=1)])
+    moments = numpy.zeros((len(centers), 3))
+    moments[:, 2] = -numpy.pi * radii ** 2 * (heights[:, 1] - heights[:, 0])
+    # covariance of the uniform distribution in the cylinder
+    covariances = numpy.zeros((len(centers), 3, 3))
+    covariances[:, 0, 0] = 0.25 * radii ** 2
+    covariances[:, 1, 1] = 0.25 * radii ** 2
+    covariances[:, 2, 2] = half_height ** 2 / 3.0
+    tree = _SourceTree(
+        positions,
+        numpy.sqrt(radii ** 2 + half_height ** 2),
+        covariances,
+        moments,
+        leaf_size,
+    )
+    return _fast_sum(
+        X,
+        (tree, _dots_direct, (centers, radii, heights, method), theta, order, box_size),
+        chunk_size,
+        num_workers,
+    )
+
+
+class _Tree(object):
+    """Binary tree over a point set, split at the median along the longest
+    edge of the bounding box until at most `leaf_size` points are left.
+
+    The cells are stored in flat arrays: cell k holds the points
+    order[start[k]:stop[k]], has the children children[k] (-1 for leaves),
+    and its bounding box has the center center[k] and the half edge lengths
+    half[k]; radius[k] = |half[k]|. The root is cell 0.
+    """
+
+    def __init__(self, positions, leaf_size):
+        order = []
+        start = []
+        stop = []
+        children = []
+        lower = []
+        upper = []
+        stack = [(numpy.arange(len(positions)), -1, 0)]
+        n = 0
+        while stack:
+            # depth first, such that each cell holds a contiguous range
+            indices, parent, i = stack.pop()
+            k = len(start)
+            if parent >= 0:
+                children[parent][i] = k
+            p = positions[indices]
+            start.append(n)
+            stop.append(n + len(indices))
+            children.append([-1, -1])
+            lower.append(p.min(axis=0))
+            upper.append(p.max(axis=0))
+            if len(indices) <= leaf_size:
+                order.append(indices)
+                n += len(indices)
+                continue
+            half = len(indices) // 2
+            axis = numpy.argmax(upper[k] - lower[k])
+            indices = indices[numpy.argpartition(p[:, axis], half)]
+            stack.extend([(indices[half:], k, 1), (indices[:half], k, 0)])
+        self.order = numpy.concatenate(order)
+        self.start = numpy.array(start)
+        self.stop = numpy.array(stop)
+        self.children = numpy.array(children)
+        self.is_leaf = self.children[:, 0] < 0
+        self.center = 0.5 * (numpy.array(lower) + numpy.array(upper))
+        self.half = 0.5 * (numpy.array(upper) - numpy.array(lower))
+        self.radius = numpy.sqrt(numpy.sum(self.half ** 2, axis=1))
+        return
+
+
+class _SourceTree(_Tree):
+    """Tree over the sources. Each source j is a distribution of dipoles with
+    the total moment m_j, the mean position x_j, the covariance S_j and the
+    extent (radius of the support around x_j) e_j; S_j and e_j are zero for
+    point dipoles. The radius of a cell bounds the supports of its sources.
+    With delta_j = x_j - c for the cell center c, the cell stores the
+    moments
+
+        M = sum_j m_j,
+        Q = sum_j m_j delta_j^T,
+        P = sum_j (m_j x delta_j) delta_j^T + [m_j x S_j],
+        s = sum_j m_j (|delta_j|^2 + tr(S_j)),
+        T = sum_j m_j (x) (delta_j delta_j^T + S_j)
+
+    needed for the second-order expansion in :func:`_expand`.
+    """
+
+    def __init__(self, positions, extents, covariances, moments, leaf_size):
+        super(_SourceTree, self).__init__(positions, leaf_size)
+        self.positions = positions
+        self.extents = extents
+        n = len(self.start)
+        self.radius = numpy.empty(n)
+        self.M = numpy.empty((n, 3))
+        self.w = numpy.empty((n, 3))
+        self.Q = numpy.empty((n, 3, 3))
+        self.P = numpy.empty((n, 3, 3))
+        self.s = numpy.empty((n, 3))
+        self.T = numpy.empty((n, 3, 3, 3))
+        for k in range(n):
+            indices = self.order[self.start[k] : self.stop[k]]
+            m = moments[indices]
+            S = covariances[indices]
+            delta = positions[indices] - self.center[k]
+            self.radius[k] = numpy.max(
+                numpy.sqrt(numpy.sum(delta ** 2, axis=1)) + extents[indices]
+            )
+            self.M[k] = m.sum(axis=0)
+            Q = numpy.dot(m.T, delta)
+            self.Q[k] = Q
+            self.w[k] = [Q[1, 2] - Q[2, 1], Q[2, 0] - Q[0, 2], Q[0, 1] - Q[1, 0]]
+            self.P[k] = numpy.dot(numpy.cross(m, delta).T, delta) + numpy.sum(
+                numpy.cross(m[:, :, None], S, axis=1), axis=0
+            )
+            self.s[k] = numpy.dot(
+                numpy.sum(delta ** 2, axis=1) + numpy.trace(S, axis1=1, axis2=2), m
+            )
+            self.T[k] = numpy.einsum(
+                "ji,jkl->ikl", m, delta[:, :, None] * delta[:, None] + S
+            )
+        return
+
+
+def _expand(tree, cells, r):
+    """Potentials of the cells of `tree` at the offsets r from their centers.
+    Taylor expansion of K(r) = r/|r|^3 in
+
+        sum_j m_j x K(r - delta_j)
+
+    up to second order gives
+
+        M x K(r) - w/|r|^3 + 3 (Q r) x r/|r|^5
+          - 3 P r/|r|^5 - 3/2 s x r/|r|^5 + 15/2 (T:rr) x r/|r|^7
+
+    where w_i = eps_ikl Q_kl. The error is of the order (radius/|r|)^3.
+    """
+    d2 = numpy.sum(r ** 2, axis=1)[:, None]
+    d3 = d2 * numpy.sqrt(d2)
+    d5 = d3 * d2
+    Qr = numpy.einsum("nij,nj->ni", tree.Q[cells], r)
+    Pr = numpy.einsum("nij,nj->ni", tree.P[cells], r)
+    Trr = numpy.einsum("nikl,nk,nl->ni", tree.T[cells], r, r)
+    return (
+        (_cross(tree.M[cells], r) - tree.w[cells]) / d3
+        + (3 * _cross(Qr, r) - 3 * Pr - 1.5 * _cross(tree.s[cells], r)) / d5
+        + 7.5 * _cross(Trr, r) / (d5 * d2)
+    )
+
+
+def _cross(a, b):
+    """Row-wise cross product; a faster numpy.cross for (n, 3)-arrays.
+    """
+    a = numpy.broadcast_to(a, b.shape)
+    return numpy.column_stack(
+        [
+            a[:, 1] * b[:, 2] - a[:, 2] * b[:, 1],
+            a[:, 2] * b[:, 0] - a[:, 0] * b[:, 2],
+            a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0],
+        ]
+    )
+
+
+def _fast_sum(X, args, chunk_size, num_workers):
+    """Sorts the nodes such that the chunks are spatially compact, and
+    evaluates :func:`_sum_boxes` on the chunks.
+    """
+    X = _pad(X)
+    order = _Tree(X, chunk_size).order
+    A = numpy.empty((len(X), 3))
+    A[order] = evaluate(
+        _sum_boxes, X[order], args=args, chunk_size=chunk_size, num_workers=num_workers
+    )
+    return A
+
+
+def _sum_boxes(X, sources, direct, data, theta, order, box_size):
+    """Potential of all sources at the nodes X, see :func:`dipoles`.
+    """
+    boxes = _Tree(X, box_size)
+
+    # Chebyshev points in the boxes; a single point for (numerically) flat
+    # dimensions, e.g., z for 2D meshes.
+    t = numpy.cos((2 * numpy.arange(order) + 1) * numpy.pi / (2 * order))
+    points = [
+        t if boxes.half[0, i] > 1.0e-10 * boxes.radius[0] else numpy.zeros(1)
+        for i in range(3)
+    ]
+    shape = tuple(len(p) for p in points)
+    num_points = numpy.prod(shape)
+    grid = numpy.stack(numpy.meshgrid(*points, indexing="ij"), axis=-1)
+    Y = boxes.center[:, None] + boxes.half[:, None] * grid.reshape(-1, 3)
+    Y = Y.reshape(-1, 3)
+
+    far, near, far_sources, near_sources = _traverse(
+        boxes, sources, theta, theta ** (3.0 / order)
+    )
+
+    # For boxes with fewer nodes than points, evaluate at the nodes.
+    use_nodes = boxes.stop - boxes.start <= num_points
+    near = numpy.column_stack([near, far[:, use_nodes[far[0]]]])
+    far = far[:, ~use_nodes[far[0]]]
+    near_sources = numpy.column_stack(
+        [near_sources, far_sources[:, use_nodes[far_sources[0]]]]
+    )
+    far_sources = far_sources[:, ~use_nodes[far_sources[0]]]
+
+    def expand(Z, cells):
+        return _expand(sources, cells, Z - sources.center[cells])
+
+    def sum_direct(Z, indices):
+        return direct(Z, indices, data)
+
+    F = numpy.zeros((len(Y), 3))
+    A = numpy.zeros((len(X), 3))
+    b, c = far
+    _accumulate(
+        F, Y, numpy.arange(len(Y)), b * num_points, (b + 1) * num_points, c, expand
+    )
+    b, j = far_sources
+    _accumulate(
+        F, Y, numpy.arange(len(Y)), b * num_points, (b + 1) * num_points, j, sum_direct
+    )
+    b, c = near
+    _accumulate(A, X, boxes.order, boxes.start[b], boxes.stop[b], c, expand)
+    b, j = near_sources
+    _accumulate(A, X, boxes.order, boxes.start[b], boxes.stop[b], j, sum_direct)
+
+    # tensor-product Lagrange interpolation of F to the nodes of each box
+    F = F.reshape((-1,) + shape + (3,))
+    b = numpy.flatnonzero(numpy.any(F.reshape(len(F), -1) != 0, axis=1))
+    half = numpy.where(boxes.half > 0, boxes.half, 1.0)
+
+    def interpolate(Z, b):
+        L = [
+            _lagrange(points[i], (Z[:, i] - boxes.center[b, i]) / half[b, i])
+            if len(points[i]) > 1
+            else numpy.ones((len(Z), 1))
+            for i in range(3)
+        ]
+        W = L[0][:, :, None, None] * L[1][:, None, :, None] * L[2][:, None, None, :]
+        return numpy.einsum(
+            "nk,nkd->nd", W.reshape(len(Z), -1), F[b].reshape(len(Z), -1, 3)
+        )
+
+    _accumulate(A, X, boxes.order, boxes.start[b], boxes.stop[b], b, interpolate)
+    return A
+
+
+def _traverse(boxes, sources, theta, eta):
+    """Traverses the box and the source tree together, starting from the
+    roots, and sorts the interactions into
+
+      * far: pairs (box, cell) for which the expansion of the cell is
+        evaluated at the points of the box,
+      * near: pairs (box, cell) for which the expansion is evaluated at the
+        nodes of the box,
+      * far_sources, near_sources: the same for pairs (box, source) that are
+        summed exactly.
+    """
+    far = [[], []]
+    near = [[], []]
+    far_sources = [[], []]
+    near_sources = [[], []]
+    b = numpy.zeros(1, dtype=int)
+    c = numpy.zeros(1, dtype=int)
+    while len(b) > 0:
+        d = numpy.sqrt(numpy.sum((boxes.center[b] - sources.center[c]) ** 2, axis=1))
+        r = boxes.radius[b]
+        rho = sources.radius[c]
+        can_expand = rho < theta * (d - r)
+        can_interpolate = r < eta * (d - rho)
+        box_is_leaf = boxes.is_leaf[b]
+        cell_is_leaf = sources.is_leaf[c]
+
+        is_far = can_expand & can_interpolate
+        is_near = ~is_far & can_expand & box_is_leaf
+        # All sources of the cell are far enough for the interpolation.
+        is_far_leaf = ~can_expand & can_interpolate & cell_is_leaf
+        is_leaf_pair = ~can_expand & ~can_interpolate & box_is_leaf & cell_is_leaf
+        for out, mask in [(far, is_far), (near, is_near)]:
+            out[0].append(b[mask])
+            out[1].append(c[mask])
+
+        # single sources
+        mask = is_far_leaf | is_leaf_pair
+        i, k = _ranges(sources.start[c[mask]], sources.stop[c[mask]])
+        bs = b[mask][i]
+        js = sources.order[k]
+        ds = numpy.sqrt(
+            numpy.sum((boxes.center[bs] - sources.positions[js]) ** 2, axis=1)
+        )
+        is_far_source = boxes.radius[bs] < eta * (ds - sources.extents[js])
+        for out, mask in [(far_sources, is_far_source), (near_sources, ~is_far_source)]:
+            out[0].append(bs[mask])
+            out[1].append(js[mask])
+
+        # Split the box if that helps the interpolation or the cell cannot be
+        # split, otherwise the cell.
+        is_open = ~(is_far | is_near | is_far_leaf | is_leaf_pair)
+        split_box = (
+            is_open
+            & ~box_is_leaf
+            & (cell_is_leaf | can_expand | (~can_interpolate & (r > rho)))
+        )
+        split_cell = is_open & ~split_box
+        b = numpy.concatenate(
+            [boxes.children[b[split_box]].reshape(-1), numpy.repeat(b[split_cell], 2)]
+        )
+        c = numpy.concatenate(
+            [numpy.repeat(c[split_box], 2), sources.children[c[split_cell]].reshape(-1)]
+        )
+    return [
+        numpy.array([numpy.concatenate(out[0]), numpy.concatenate(out[1])])
+        for out in [far, near, far_sources, near_sources]
+    ]
+
+
+def _ranges(start, stop):
+    """Returns the indices i, k with start[i] <= k < stop[i] for all i."""
+    counts = stop - start
+    i = numpy.repeat(numpy.arange(len(start)), counts)
+    offsets = numpy.cumsum(counts) - counts
+    return i, numpy.arange(len(i)) - offsets[i] + start[i]
+
+
+# Number of (target, source) pairs treated at once in the fast summation.
+_PAIR_BLOCK_SIZE = 2 ** 14
+
+
+def _accumulate(out, Z, targets, start, stop, sources, fun):
+    """Adds fun(Z[t], sources[i]) to out[t] for all t = targets[k] with
+    start[i] <= k < stop[i], in blocks of _PAIR_BLOCK_SIZE pairs.
+    """
+    i, k = _ranges(start, stop)
+    t = targets[k]
+    s = sources[i]
+    for block in range(0, len(t), _PAIR_BLOCK_SIZE):
+        tb = t[block : block + _PAIR_BLOCK_SIZE]
+        values = fun(Z[tb], s[block : block + _PAIR_BLOCK_SIZE])
+        for axis in range(3):
+            out[:, axis] += numpy.bincount(
+                tb, weights=values[:, axis], minlength=len(out)
+            )
+    return
+
+
+def _lagrange(points, x):
+    """Values of the Lagrange polynomials for `points` at x, shape
+    (len(x), len(points)).
+    """
+    L = numpy.ones((len(x), len(points)))
+    for k, p in enumerate(points):
+        for j, q in enumerate(points):
+            if j != k:
+                L[:, k] *= (x - q) / (p - q)
+    return L
+
+
+def _dipoles_direct(X, indices, data):
+    """Potentials of the dipoles indices[k] at the nodes X[k].
+    """
+    x0, m = data
+    r = X - x0[indices]
+    d2 = numpy.sum(r ** 2, axis=1)[:, None]
+    return _cross(m[indices], r) / (d2 * numpy.sqrt(d2))
+
+
+def _dots_direct(X, indices, data):
+    """Potentials of the dots indices[k] at the nodes X[k].
+    """
+    centers, radii, heights, method = data
+    A = numpy.empty((len(X), 3))
+    for j in numpy.unique(indices):
+        mask = indices == j
+        shift = numpy.array([centers[j, 0], centers[j, 1], 0.0])
+        A[mask] = magnetic_dot(X[mask] - shift, radii[j], heights[j], method=method)
+    return A
+
+
+def _pad(X):
+    """Appends the z-component 0 to 2D nodes."""
+    if X.shape[1] == 2:
+        return numpy.column_stack([X, numpy.zeros(len(X))])
+    return X
+
+
+# Number of nodes treated at once in the vectorized dot potentials; the
+# temporaries are of size _DOT_BLOCK_SIZE x (number of disk segments).
+_DOT_BLOCK_SIZE = 256
+
+
+def _get_disk_segments(radius, n_phi=100):
+    """Returns the centers of the disk segments used for the quadrature and
+    their volumes.
+    """
+    # Choose such that the quads at radius/2 are approximately squares.
+    n_radius = int(round(n_phi / numpy.pi))
+    dr = radius / n_radius
+    beta = 2.0 * numpy.pi / n_phi * numpy.arange(n_phi)
+    rad = radius / n_radius * (numpy.arange(n_radius) + 0.5)
+    # Volume of circle segment = pi*angular_width * r^2,
+    # so the volume of a building brick of the discretization is
+    #   V = pi/n_phi * [(r+dr/2)^2 - (r-dr/2)^2]
+    #     = pi/n_phi * 2 * r * dr.
+    x = numpy.outer(numpy.cos(beta), rad).reshape(-1)
+    y = numpy.outer(numpy.sin(beta), rad).reshape(-1)
+    volumes = numpy.tile(numpy.pi / n_phi * (2.0 * rad * dr), n_phi)
+    return x, y, volumes
+
+
+def _magnetic_dot_quadrature(X, radius, heights):
+    """The dot potential at the nodes X, computed with the same quadrature as
+    :func:`_magnetic_dot_loop`, but for all nodes and disk segments at once.
+    """
+    seg_x, seg_y, volumes = _get_disk_segments(radius)
+    x_dist = X[:, [0]] - seg_x
+    y_dist = X[:, [1]] - seg_y
+    R = x_dist ** 2 + y_dist ** 2
+    is_valid = R > 1.0e-15
+    R[~is_valid] = 1.0
+    alpha = (
+        (
+            heights[1] / numpy.sqrt(R + heights[1] ** 2)
+            - heights[0] / numpy.sqrt(R + heights[0] ** 2)
+        )
+        / R
+        * volumes
+    )
+    alpha[~is_valid] = 0.0
+    A = numpy.zeros((len(X), 3))
+    A[:, 0] = numpy.sum(y_dist * alpha, axis=1)
+    A[:, 1] = -numpy.sum(x_dist * alpha, axis=1)
+    return A
+
+
+@functools.lru_cache()
+def _get_gauss_legendre(n):
+    return numpy.polynomial.legendre.leggauss(n)
+
+
+def _magnetic_dot_elliptic(X, radius, heights, n_gauss=32):
+    """The dot potential via the equivalent stack of current loops.
+
+    A dot that is magnetized in z-direction is equivalent to the surface
+    current density 1 along its mantle. The potential of a single loop of
+    radius a at height h is (in the units of :func:`magnetic_dipole`)
+
+    .. math::
+        A_\\phi = -\\frac{4}{k}\\sqrt{\\frac{a}{\\rho}}
+            \\left[(1-k^2/2) K(k^2) - E(k^2)\\right],\\quad
+        k^2 = \\frac{4a\\rho}{(a+\\rho)^2 + (h-z)^2}
+
+    with the complete elliptic integrals K, E. The sign matches the
+    orientation of the other methods.
+    """
+    from scipy.special import ellipe, ellipk
+
+    rho = numpy.sqrt(X[:, 0] ** 2 + X[:, 1] ** 2)
+    z = X[:, 2] if X.shape[1] > 2 else numpy.zeros(len(X))
+    is_valid = rho > 1.0e-15
+    rho_valid = rho[is_valid]
+
+    # Gauss-Legendre points and weights in [height0, height1]
+    t, w = _get_gauss_legendre(n_gauss)
+    h = 0.5 * (heights[1] - heights[0]) * t + 0.5 * (heights[1] + heights[0])
+    w = 0.5 * (heights[1] - heights[0]) * w
+
+    m = (
+        4.0
+        * radius
+        * rho_valid[:, None]
+        / ((radius + rho_valid[:, None]) ** 2 + (h - z[is_valid, None]) ** 2)
+    )
+    A_phi = numpy.zeros(len(X))
+    A_phi[is_valid] = -numpy.dot(
+        4.0
+        / numpy.sqrt(m)
+        * numpy.sqrt(radius / rho_valid[:, None])
+        * ((1.0 - 0.5 * m) * ellipk(m) - ellipe(m)),
+        w,
+    )
+
+    A = numpy.zeros((len(X), 3))
+    A[is_valid, 0] = -A_phi[is_valid] * X[is_valid, 1] / rho_valid
+    A[is_valid, 1] = A_phi[is_valid] * X[is_valid, 0] / rho_valid
+    return A
+
+
+def _magnetic_dot_loop(X, radius, heights):
+    """Reference implementation of the "quadrature" method of
+    :func:`magnetic_dot`.
     """
     # Span a cartesian grid over the sample, and integrate over it.
     # For symmetry, choose a number that is divided by 4.
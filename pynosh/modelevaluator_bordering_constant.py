@@ -6,8 +6,10 @@ import krypy
 
 class ConstBorderedModelEvaluator(object):
     """
-    Wraps a given model evaluator in a bordering strategy. Does not work with
-    preconditioners.
+    Wraps a given model evaluator in a bordering strategy.
+
+    Additional keyword arguments of the methods (e.g., mu, g) are passed on to
+    the inner model evaluator.
     """
 
     def __init__(self, modeleval, bord):
@@ -18,27 +20,29 @@ class ConstBorderedModelEvaluator(object):
         self.bord = bord
         return
 
-    def compute_f(self, x):
+    def compute_f(self, x, **kwargs):
         """Compute bordered F.
         """
         n = len(x) - 1
         res = numpy.empty((n + 1, 1), dtype=self.dtype)
         # Right border: bord * eta.
-        res[0:n] = self.inner_modeleval.compute_f(x[0:n]) + self.bord * x[n]
+        res[0:n] = self.inner_modeleval.compute_f(x[0:n], **kwargs) + self.bord * x[n]
         # Lower border: <bord, psi>.
         res[n] = self.inner_modeleval.inner_product(self.bord, x[0:n])
         return res
 
-    def get_jacobian(self, x0):
+    def get_jacobian(self, x0, **kwargs):
         """Jacobian of the bordered system.
         """
 
         def _apply_jacobian(x):
+            shape = x.shape
+            x = x.reshape(n + 1, -1)
             y = numpy.empty(x.shape, dtype=self.dtype)
-            y[0:n] = inner_jacobian * x[0:n] + b.reshape(x[0:n].shape) * x[n]
-            assert abs(x[n].imag) < 1.0e-15, "Not real-valued: %r." % x[n]
+            y[0:n] = inner_jacobian * x[0:n] + b.reshape(n, 1) * x[n]
+            assert numpy.all(abs(x[n].imag) < 1.0e-15), "Not real-valued: %r." % x[n]
             y[n] = self.inner_modeleval.inner_product(c, x[0:n]) + d * x[n].real
-            return y
+            return y.reshape(shape)
 
         assert x0 is not None
 
@@ -49,110 +53,352 @@ class ConstBorderedModelEvaluator(object):
         c = self.bord
         d = 0.0
 
-        inner_jacobian = self.inner_modeleval.get_jacobian(psi0)
-        return LinearOperator((n + 1, n + 1), _apply_jacobian, dtype=self.dtype)
+        inner_jacobian = self.inner_modeleval.get_jacobian(psi0, **kwargs)
+        return LinearOperator(
+            (n + 1, n + 1), _apply_jacobian, matmat=_apply_jacobian, dtype=self.dtype
+        )
 
-    def get_jacobian_inverse(self, x0):
-        """Preconditioner based on Schur complement.
+    def _get_schur_inverse(self, inner_solve, n):
+        """Returns the inverse of the bordered operator
+
+            [A   b]
+            [c*  d]
+
+        via the Schur complement, where `inner_solve` (approximately) applies
+        the inverse of A to a block of vectors. A^{-1} b, the Schur complement
+        s = d - <c, A^{-1} b> are computed here once, so every application
+        only costs one inner solve (for all columns of the input at once).
         """
+        b = self.bord.reshape(n, 1)
+        c = self.bord.reshape(n, 1)
+        d = 0.0
 
-        def _apply_jacobian_inverse(x):
+        z1 = inner_solve(b)
+        # Schur complement.
+        s = d - self.inner_modeleval.inner_product(c, z1)
+        assert abs(s) > 1.0e-15
+        assert abs(s.imag) < 1.0e-15
+        s = s.real.item()
+
+        def _apply_inverse(x):
             """Schur thing."""
-            # Test: Use with Jacobian solved exactly.
-            phi0 = x[0:n]
-            phi0 = phi0.reshape((n, 1))
-
-            linear_system0 = krypy.linsys.LinearSystem(
-                jacobian, phi0, ip_B=self.inner_modeleval.inner_product
-            )
-            out0 = krypy.linalg.Minres(linear_system0, tol=1.0e-11, maxiter=500)
-            z0 = out0.xk.reshape(n)
-
-            linear_system1 = krypy.linsys.LinearSystem(
-                jacobian, b, ip_B=self.inner_modeleval.inner_product
-            )
-            out1 = krypy.linalg.Minres(linear_system1, tol=1.0e-11, maxiter=500)
-            z1 = out1.xk.reshape(n)
-
-            # Schur complement.
-            s = d - self.inner_modeleval.inner_product(c, z1)
-            assert abs(s) > 1.0e-15
-            tmp = self.inner_modeleval.inner_product(c, z0)
-
-            assert abs(s.imag) < 1.0e-15
-            s = s.real
-            assert abs(tmp.imag) < 1.0e-15
-            tmp = tmp.real
-            assert abs(x[n].imag) < 1.0e-15
-            xn = x[n].real
+            shape = x.shape
+            x = x.reshape(n + 1, -1)
+            z0 = inner_solve(x[0:n])
+            tmp = numpy.asarray(self.inner_modeleval.inner_product(c, z0))
+            assert numpy.all(abs(tmp.imag) < 1.0e-15)
+            tmp = tmp.real.reshape(1, -1)
+            assert numpy.all(abs(x[n].imag) < 1.0e-15)
+            xn = x[n].real.reshape(1, -1)
 
             y = numpy.empty(x.shape, dtype=self.dtype)
-            y[0:n] = z0 + z1 * 1.0 / s * tmp - z1 / s * xn
-            y[n] = -1.0 / s * tmp + 1.0 / s * xn
-            return y
+            y[0:n] = z0 + z1 * ((tmp - xn) / s)
+            y[n] = (xn - tmp)[0] / s
+            return y.reshape(shape)
+
+        return LinearOperator(
+            (n + 1, n + 1), _apply_inverse, matmat=_apply_inverse, dtype=self.dtype
+        )
+
+    def get_jacobian_inverse(self, x0, **kwargs):
+        """Preconditioner based on Schur complement.
+        """
+
+        def _inner_solve(phi):
+            # krypy doesn't have block solvers, so solve column by column.
+            z = numpy.empty(phi.shape, dtype=self.dtype)
+            for i in range(phi.shape[1]):
+                linear_system = krypy.linsys.LinearSystem(
+                    jacobian,
+                    phi[:, [i]],
+                    ip_B=self.inner_modeleval.inner_product,
+                    self_adjoint=True,
+                )
+                out = krypy.linsys.Minres(linear_system, tol=1.0e-11, maxiter=500)
+                z[:, [i]] = out.xk
+            return z
 
         n = len(x0) - 1
         psi0 = x0[0:n]
 
-        b = self.bord
-        c = self.bord
-        d = 0.0
+        jacobian = self.inner_modeleval.get_jacobian(psi0, **kwargs)
+        return self._get_schur_inverse(_inner_solve, n)
 
-        jacobian = self.inner_modeleval.get_jacobian(psi0)
-        # prec = self.inner_modeleval.get_preconditioner_inverse(psi0)
-        return LinearOperator((n + 1, n + 1), _apply_jacobian_inverse, dtype=self.dtype)
+    def _get_schur_approximation(self, prec, n):
+        """Cheap approximation
 
-    def get_preconditioner(self, psi0):
-        # Preconditioner not supported.
-        return None
+        .. math::
+            \\sigma = \\frac{\\langle b, b\\rangle^2}{\\langle b, M b\\rangle}
+            \\approx \\langle b, M^{-1} b\\rangle = -s
 
-    def get_preconditioner_inverse(self, x0):
-        """Preconditioner based on Schur complement.
+        of the (negative) Schur complement of the bordered preconditioner
+        with the inner preconditioner M; it only takes one application of M.
         """
+        b = self.bord.reshape(n, 1)
+        bb = self.inner_modeleval.inner_product(b, b).real.item()
+        bMb = self.inner_modeleval.inner_product(b, prec * b).real.item()
+        assert bMb > 0.0
+        return bb ** 2 / bMb
 
-        def _apply_precon_inverse(x):
-            """Schur thing."""
-            # Approximate solutions of
-            #    J^{-1} phi
-            # and
-            #    J^{-1} b.
-            z0 = prec * x[0:n]
-            z1 = prec * b.reshape(z0.shape)
-
-            # Schur complement.
-            s = d - self.inner_modeleval.inner_product(c, z1)
-            assert abs(s) > 1.0e-15
-            tmp = self.inner_modeleval.inner_product(c, z0)
-
-            assert abs(s.imag) < 1.0e-15
-            s = s.real
-            assert abs(tmp.imag) < 1.0e-15
-            tmp = tmp.real
-            assert abs(x[n].imag) < 1.0e-15
-            xn = x[n].real
+    def get_preconditioner(self, x0, **kwargs):
+        """Block-diagonal preconditioner
+
+        .. math::
+            \\begin{pmatrix} M & 0\\\\ 0 & \\sigma\\end{pmatrix}
 
+        with the preconditioner M of the inner model evaluator and the
+        approximate Schur complement :math:`\\sigma` (see
+        :meth:`_get_schur_approximation`). Other than the bordered operator
+        itself, it's positive definite and hence fit for MINRES.
+        """
+
+        def _apply_precon(x):
+            shape = x.shape
+            x = x.reshape(n + 1, -1)
             y = numpy.empty(x.shape, dtype=self.dtype)
-            y[0:n] = z0 + z1 * 1.0 / s * tmp - z1 / s * xn
-            y[n] = -1.0 / s * tmp + 1.0 / s * xn
-            return y
+            y[0:n] = prec * x[0:n]
+            y[n] = sigma * x[n]
+            return y.reshape(shape)
 
         n = len(x0) - 1
         psi0 = x0[0:n]
 
-        b = self.bord
-        c = self.bord
-        d = 0.0
+        prec = self.inner_modeleval.get_preconditioner(psi0, **kwargs)
+        if prec is None:
+            return None
+        sigma = self._get_schur_approximation(prec, n)
+        return LinearOperator(
+            (n + 1, n + 1), _apply_precon, matmat=_apply_precon, dtype=self.dtype
+        )
+
+    def get_preconditioner_inverse(self, x0, **kwargs):
+        """Inverse of the block-diagonal preconditioner (see
+        :meth:`get_preconditioner`), i.e., the inner AMG preconditioner and
+        :math:`1/\\sigma`.
+        """
+
+        def _apply_precon_inverse(x):
+            shape = x.shape
+            x = x.reshape(n + 1, -1)
+            y = numpy.empty(x.shape, dtype=self.dtype)
+            y[0:n] = prec_inverse * x[0:n]
+            y[n] = x[n] / sigma
+            return y.reshape(shape)
+
+        n = len(x0) - 1
+        psi0 = x0[0:n]
 
-        prec = self.inner_modeleval.get_preconditioner_inverse(psi0)
-        if prec:
-            return LinearOperator(
-                (n + 1, n + 1), _apply_precon_inverse, dtype=self.dtype
-            )
-        else:
+        prec = self.inner_modeleval.get_preconditioner(psi0, **kwargs)
+        prec_inverse = self.inner_modeleval.get_preconditioner_inverse(psi0, **kwargs)
+        if prec is None or prec_inverse is None:
             return None
+        sigma = self._get_schur_approximation(prec, n)
+        return LinearOperator(
+            (n + 1, n + 1),
+            _apply_precon_inverse,
+            matmat=_apply_precon_inverse,
+            dtype=self.dtype,
+        )
 
     def inner_product(self, x0, x1):
         """The inner product of the bordered problem.
         """
         n = len(x0) - 1
-        return self.inner_modeleval.inner_product(x0[0:n], x1[0:n]) + x0[n] * x1[n]
+        x0 = x0.reshape(n + 1, -1)
+        x1 = x1.reshape(n + 1, -1)
+        return (
+            self.inner_modeleval.inner_product(x0[0:n], x1[0:n])
+            + numpy.outer(x0[n].conj(), x1[n]).real
+        )
+
+
+class ConstMultiBorderedModelEvaluator(object):
+    """
+    Wraps a given model evaluator in a bordering strategy with k constraints
+    at once, i.e., the bordered operator is
+
+        [A   B]
+        [B*  0]
+
+    where the k border vectors form the columns of B (shape (n, k)). The
+    last k entries of the state are real. All operators work on blocks, and
+    the k×k Schur complements are computed and factorized once per
+    linearization.
+
+    Additional keyword arguments of the methods (e.g., mu, g) are passed on to
+    the inner model evaluator.
+    """
+
+    def __init__(self, modeleval, bords):
+        """Initialization.
+        """
+        self.inner_modeleval = modeleval
+        self.dtype = self.inner_modeleval.dtype
+        self.bords = bords
+        self.num_borders = bords.shape[1]
+        return
+
+    def _split(self, x):
+        """Returns n, x reshaped into a block of columns, and the original
+        shape of x.
+        """
+        n = len(x) - self.num_borders
+        return n, x.reshape(n + self.num_borders, -1), x.shape
+
+    def compute_f(self, x, **kwargs):
+        """Compute bordered F.
+        """
+        n, x, _ = self._split(x)
+        res = numpy.empty(x.shape, dtype=self.dtype)
+        # Right border: B * t.
+        res[0:n] = self.inner_modeleval.compute_f(x[0:n], **kwargs) + numpy.dot(
+            self.bords, x[n:].real
+        )
+        # Lower border: <B, psi>.
+        res[n:] = self.inner_modeleval.inner_product(self.bords, x[0:n])
+        return res
+
+    def get_jacobian(self, x0, **kwargs):
+        """Jacobian of the bordered system.
+        """
+
+        def _apply_jacobian(x):
+            _, x, shape = self._split(x)
+            assert numpy.all(abs(x[n:].imag) < 1.0e-15), "Not real-valued."
+            y = numpy.empty(x.shape, dtype=self.dtype)
+            y[0:n] = inner_jacobian * x[0:n] + numpy.dot(self.bords, x[n:].real)
+            y[n:] = self.inner_modeleval.inner_product(self.bords, x[0:n])
+            return y.reshape(shape)
+
+        n = len(x0) - self.num_borders
+        inner_jacobian = self.inner_modeleval.get_jacobian(x0[0:n], **kwargs)
+        N = n + self.num_borders
+        return LinearOperator(
+            (N, N), _apply_jacobian, matmat=_apply_jacobian, dtype=self.dtype
+        )
+
+    def get_jacobian_inverse(self, x0, **kwargs):
+        """Inverse of the Jacobian via the k×k Schur complement
+        :math:`S = -\\langle B, A^{-1}B\\rangle`. :math:`A^{-1}B` and the LU
+        factorization of S are computed here, so each application takes one
+        inner solve per column.
+        """
+        import scipy.linalg
+
+        def _inner_solve(phi):
+            # krypy doesn't have block solvers, so solve column by column.
+            z = numpy.empty(phi.shape, dtype=self.dtype)
+            for i in range(phi.shape[1]):
+                linear_system = krypy.linsys.LinearSystem(
+                    jacobian,
+                    phi[:, [i]],
+                    ip_B=self.inner_modeleval.inner_product,
+                    self_adjoint=True,
+                )
+                out = krypy.linsys.Minres(linear_system, tol=1.0e-11, maxiter=500)
+                z[:, [i]] = out.xk
+            return z
+
+        def _apply_jacobian_inverse(x):
+            _, x, shape = self._split(x)
+            z0 = _inner_solve(x[0:n])
+            rhs = x[n:].real - self.inner_modeleval.inner_product(self.bords, z0)
+            t = scipy.linalg.lu_solve(schur_lu, rhs)
+            y = numpy.empty(x.shape, dtype=self.dtype)
+            y[0:n] = z0 - numpy.dot(Z1, t)
+            y[n:] = t
+            return y.reshape(shape)
+
+        n = len(x0) - self.num_borders
+        jacobian = self.inner_modeleval.get_jacobian(x0[0:n], **kwargs)
+        Z1 = _inner_solve(self.bords)
+        schur_lu = scipy.linalg.lu_factor(
+            -self.inner_modeleval.inner_product(self.bords, Z1)
+        )
+        N = n + self.num_borders
+        return LinearOperator(
+            (N, N),
+            _apply_jacobian_inverse,
+            matmat=_apply_jacobian_inverse,
+            dtype=self.dtype,
+        )
+
+    def _get_schur_approximation(self, prec):
+        """Cheap approximation
+
+        .. math::
+            \\Sigma = G (B^* M B)^{-1} G \\approx B^* M^{-1} B,
+            \\quad G = B^* B,
+
+        of the (negative) Schur complement of the bordered preconditioner
+        (inner products in the sense of the inner model evaluator). It only
+        takes k applications of M.
+        """
+        import scipy.linalg
+
+        G = self.inner_modeleval.inner_product(self.bords, self.bords)
+        BMB = self.inner_modeleval.inner_product(self.bords, prec * self.bords)
+        Sigma = numpy.dot(G, scipy.linalg.solve(BMB, G, assume_a="pos"))
+        return 0.5 * (Sigma + Sigma.T)
+
+    def get_preconditioner(self, x0, **kwargs):
+        """Block-diagonal preconditioner diag(M, Sigma) with the
+        preconditioner M of the inner model evaluator and the approximate
+        Schur complement Sigma (see :meth:`_get_schur_approximation`).
+        """
+
+        def _apply_precon(x):
+            _, x, shape = self._split(x)
+            y = numpy.empty(x.shape, dtype=self.dtype)
+            y[0:n] = prec * x[0:n]
+            y[n:] = numpy.dot(Sigma, x[n:])
+            return y.reshape(shape)
+
+        n = len(x0) - self.num_borders
+        prec = self.inner_modeleval.get_preconditioner(x0[0:n], **kwargs)
+        if prec is None:
+            return None
+        Sigma = self._get_schur_approximation(prec)
+        N = n + self.num_borders
+        return LinearOperator(
+            (N, N), _apply_precon, matmat=_apply_precon, dtype=self.dtype
+        )
+
+    def get_preconditioner_inverse(self, x0, **kwargs):
+        """Inverse of the block-diagonal preconditioner (see
+        :meth:`get_preconditioner`).
+        """
+        import scipy.linalg
+
+        def _apply_precon_inverse(x):
+            _, x, shape = self._split(x)
+            y = numpy.empty(x.shape, dtype=self.dtype)
+            y[0:n] = prec_inverse * x[0:n]
+            y[n:] = scipy.linalg.cho_solve(sigma_cho, x[n:].real)
+            return y.reshape(shape)
+
+        n = len(x0) - self.num_borders
+        prec = self.inner_modeleval.get_preconditioner(x0[0:n], **kwargs)
+        prec_inverse = self.inner_modeleval.get_preconditioner_inverse(
+            x0[0:n], **kwargs
+        )
+        if prec is None or prec_inverse is None:
+            return None
+        sigma_cho = scipy.linalg.cho_factor(self._get_schur_approximation(prec))
+        N = n + self.num_borders
+        return LinearOperator(
+            (N, N),
+            _apply_precon_inverse,
+            matmat=_apply_precon_inverse,
+            dtype=self.dtype,
+        )
+
+    def inner_product(self, x0, x1):
+        """The inner product of the bordered problem.
+        """
+        n, x0, _ = self._split(x0)
+        _, x1, _ = self._split(x1)
+        return (
+            self.inner_modeleval.inner_product(x0[0:n], x1[0:n])
+            + numpy.dot(x0[n:].T.conj(), x1[n:]).real
+        )
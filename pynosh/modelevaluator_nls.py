@@ -17,10 +17,29 @@ class NlsModelEvaluator(object):
        * Gross--Pitaevskii: :math:`g=1.0`, :math:`V` given, :math:`A=0.0`.
        * Ginzburg--Landau: :math:`g=1.0, V=-1.0`,
          and some magnetic potential :math:`A`.
+
+    `A` is either given by its values at the nodes, or as a callable
+    `A(X0, X1)` that returns the line integrals of the potential along the
+    straight edges from X0[k] to X1[k], e.g.,
+    ``functools.partial(mvp.magnetic_dipole_edge_integral, x0=x0, m=m)``.
+    The latter avoids storing nodal values and gives exact phases.
+
+    If `field_direction` is given, `A` must be a sequence of three such
+    potentials, those of the unit fields in x-, y-, and z-direction, and
+    the potential is their combination with the coefficients
+    `field_direction`. Since the edge integrals of the three are cached,
+    changing the direction with :meth:`set_field_direction` only costs the
+    update of the phases.
     """
 
     def __init__(
-        self, mesh, V=None, A=None, preconditioner_type="none", num_amg_cycles=numpy.inf
+        self,
+        mesh,
+        V=None,
+        A=None,
+        preconditioner_type="none",
+        num_amg_cycles=numpy.inf,
+        field_direction=None,
     ):
         """Initialization. Set mesh.
         """
@@ -37,6 +56,13 @@ class NlsModelEvaluator(object):
             self._raw_magnetic_vector_potential = A
         self._keo_cache = None
         self._keo_cache_mu = 0.0
+        self._keo_cache_lowprec = {}
+        self._keo_structure = None
+        self._edge_integral_cache = None
+        self._edge_integral_basis = None
+        self._field_direction = None
+        if field_direction is not None:
+            self._field_direction = numpy.array(field_direction, dtype=float)
         self._edgecoeff_cache = None
         self.tot_amg_cycles = []
         self.cv_variant = "voronoi"
@@ -44,21 +70,53 @@ class NlsModelEvaluator(object):
         self._num_amg_cycles = num_amg_cycles
         return
 
-    def compute_f(self, x, mu, g):
+    def set_field_direction(self, field_direction):
+        """Sets the coefficients of the basis potentials; see the class
+        documentation.
+        """
+        assert self._field_direction is not None
+        self._field_direction = numpy.array(field_direction, dtype=float)
+        self._edge_integral_cache = None
+        self._keo_cache = None
+        return
+
+    def compute_f(self, x, mu, g, abs2=None):
         """Computes the nonlinear Schrödinger residual
 
         .. math::
             GP(\\psi) = K\\psi + (V + g |\\psi|^2) \\psi
+
+        x may be a block of shape (n, k), in which case the residual is
+        computed for each column. If :math:`|x|^2` is already available, it
+        can be passed as `abs2`.
         """
         keo = self._get_keo(mu)
         if self.mesh.control_volumes is None:
             self.mesh.compute_control_volumes(variant=self.cv_variant)
-        res = (keo * x) / self.mesh.control_volumes.reshape(x.shape) + (
-            self._V.reshape(x.shape) + g * abs(x) ** 2
+        # Make sure the node-wise quantities broadcast over the columns of x.
+        shape = (x.shape[0],) + (1,) * (len(x.shape) - 1)
+        if abs2 is None:
+            abs2 = x.real ** 2 + x.imag ** 2
+        res = (keo * x) / self.mesh.control_volumes.reshape(shape) + (
+            self._V.reshape(shape) + g * abs2
         ) * x
         return res
 
-    def get_jacobian(self, x, mu, g):
+    def linearize(self, x, mu, g):
+        """Returns a :class:`Linearization` at x, i.e., an object through
+        which the residual, the Jacobian and the preconditioners at x are
+        retrieved sharing the work that is common to all of them.
+        """
+        return Linearization(self, x, mu, g)
+
+    def get_scaled(self):
+        """Returns the model evaluator for the scaled variables
+        :math:`D^{1/2}\\psi` with D the control volumes (see
+        :class:`ScaledNlsModelEvaluator`).
+        """
+        return ScaledNlsModelEvaluator(self)
+
+    def get_jacobian(self, x, mu, g, abs2=None, dtype=None):
         """Returns a LinearOperator object that defines the matrix-vector
         multiplication scheme for the Jacobian operator as in
 
@@ -70,6 +128,10 @@ class NlsModelEvaluator(object):
         .. math::
             A &= K + I (V + g \\cdot 2|\\psi|^2),\\\\
             B &= g \\cdot  diag( \\psi^2 ).
+
+        If :math:`|x|^2` is already available, it can be passed as `abs2`. If
+        `dtype` is given (e.g., numpy.complex64), the operator works in that
+        precision.
         """
 
         def _apply_jacobian(phi):
@@ -81,7 +143,7 @@ class NlsModelEvaluator(object):
             else:
                 raise ValueError("Illegal phi.")
             y = (
-                (keo * phi) / self.mesh.control_volumes.reshape(shape)
+                (keo * phi) / cv.reshape(shape)
                 + alpha.reshape(shape) * phi
                 + gPsi0Squared.reshape(shape) * phi.conj()
             )
@@ -89,18 +151,21 @@ class NlsModelEvaluator(object):
 
         assert x is not None
 
-        keo = self._get_keo(mu)
+        if dtype is None:
+            dtype = self.dtype
+        keo = self._get_keo(mu, dtype)
 
-        if self.mesh.control_volumes is None:
-            self.mesh.compute_control_volumes(variant=self.cv_variant)
-        alpha = self._V.reshape(x.shape) + g * 2.0 * (x.real ** 2 + x.imag ** 2)
-        gPsi0Squared = g * x ** 2
+        cv = self._get_control_volumes(dtype)
+        if abs2 is None:
+            abs2 = x.real ** 2 + x.imag ** 2
+        alpha = (self._V.reshape(x.shape) + g * 2.0 * abs2).astype(dtype)
+        gPsi0Squared = (g * x ** 2).astype(dtype)
 
         num_unknowns = len(self.mesh.node_coords)
 
         return krypy.utils.LinearOperator(
             (num_unknowns, num_unknowns),
-            self.dtype,
+            dtype,
             dot=_apply_jacobian,
             dot_adj=_apply_jacobian,
         )
@@ -134,7 +199,7 @@ class NlsModelEvaluator(object):
         )
         return A, B
 
-    def get_preconditioner(self, x, mu, g):
+    def get_preconditioner(self, x, mu, g, abs2=None, dtype=None):
         """Return the preconditioner.
         """
         if self._preconditioner_type == "none":
@@ -147,36 +212,44 @@ class NlsModelEvaluator(object):
             )
 
         def _apply_precon(phi):
-            return (keo * phi) / self.mesh.control_volumes.reshape(
-                phi.shape
-            ) + alpha.reshape(phi.shape) * phi
-            # + beta.reshape(phi.shape) * phi.conj()
+            shape = (phi.shape[0],) + (1,) * (len(phi.shape) - 1)
+            return (keo * phi) / cv.reshape(shape) + alpha.reshape(shape) * phi
+            # + beta.reshape(shape) * phi.conj()
 
         assert x is not None
 
-        keo = self._get_keo(mu)
-
-        if self.mesh.control_volumes is None:
-            self.mesh.compute_control_volumes(variant=self.cv_variant)
+        if dtype is None:
+            dtype = self.dtype
+        keo = self._get_keo(mu, dtype)
+        cv = self._get_control_volumes(dtype)
 
         if g > 0.0:
-            alpha = g * 2.0 * (x.real ** 2 + x.imag ** 2)
+            if abs2 is None:
+                abs2 = x.real ** 2 + x.imag ** 2
+            alpha = (g * 2.0 * abs2).astype(cv.dtype)
             # beta = g * x**2
         else:
-            alpha = numpy.zeros(len(x))
+            alpha = numpy.zeros(len(x), dtype=cv.dtype)
         num_unknowns = len(self.mesh.node_coords)
         return krypy.utils.LinearOperator(
-            (num_unknowns, num_unknowns), self.dtype, dot=_apply_precon
+            (num_unknowns, num_unknowns), dtype, dot=_apply_precon
         )
 
-    def get_preconditioner_inverse(self, x, mu, g):
-        """Use AMG to invert M approximately.
+    def get_preconditioner_inverse(self, x, mu, g, abs2=None, dtype=None):
+        """Use AMG to invert M approximately. If `dtype` is given (e.g.,
+        numpy.complex64), the operator takes and returns vectors of that
+        precision. The AMG hierarchy is always built and applied in double
+        precision (pyamg's evolution strength measure doesn't support
+        complex64).
         """
         if self._preconditioner_type == "none":
             return None
         import pyamg
 
         num_unknowns = len(x)
+        if dtype is None:
+            dtype = self.dtype
+        cv = self._get_control_volumes(self.dtype)
 
         def _apply_inverse_prec_exact(phi):
             assert len(phi.shape) == 2
@@ -201,9 +274,9 @@ class NlsModelEvaluator(object):
             return sol
 
         def _apply_inverse_prec_cycles(phi):
-            rhs = self.mesh.control_volumes.reshape((phi.shape[0], 1)) * phi
-            x_init = numpy.zeros((num_unknowns, 1), dtype=complex)
-            x = numpy.empty(phi.shape, dtype=complex)
+            rhs = cv.reshape((phi.shape[0], 1)) * phi
+            x_init = numpy.zeros((num_unknowns, 1), dtype=self.dtype)
+            x = numpy.empty(phi.shape, dtype=dtype)
             residuals = []
             for i in range(rhs.shape[1]):
                 x[:, i] = prec_amg_solver.solve(
@@ -220,19 +293,14 @@ class NlsModelEvaluator(object):
             self.tot_amg_cycles += [self._num_amg_cycles]
             return x
 
-        keo = self._get_keo(mu)
+        keo = self._get_keo(mu, self.dtype)
 
         if g > 0.0:
-            if self.mesh.control_volumes is None:
-                self.mesh.compute_control_volumes(variant=self.cv_variant)
             # don't use .setdiag,
             # cf. https://github.com/scipy/scipy/issues/3501
-            alpha = (
-                g
-                * 2.0
-                * (x.real ** 2 + x.imag ** 2)
-                * self.mesh.control_volumes.reshape(x.shape)
-            )
+            if abs2 is None:
+                abs2 = x.real ** 2 + x.imag ** 2
+            alpha = (g * 2.0 * abs2 * cv.reshape(x.shape)).astype(cv.dtype)
             prec = keo + sparse.spdiags(alpha[:, 0], [0], num_unknowns, num_unknowns)
         else:
             prec = keo
@@ -271,14 +339,12 @@ class NlsModelEvaluator(object):
             if self._num_amg_cycles == numpy.inf:
                 raise ValueError("Invalid number of cycles.")
             return krypy.utils.LinearOperator(
-                (num_unknowns, num_unknowns), self.dtype, dot=_apply_inverse_prec_cycles
+                (num_unknowns, num_unknowns), dtype, dot=_apply_inverse_prec_cycles
             )
         elif self._preconditioner_type == "exact":
             amg_prec = prec_amg_solver.aspreconditioner(cycle="V")
             return krypy.utils.LinearOperator(
-                (num_unknowns, num_unknowns),
-                dtype=self.dtype,
-                dot=_apply_inverse_prec_exact,
+                (num_unknowns, num_unknowns), dtype=dtype, dot=_apply_inverse_prec_exact
             )
         else:
             raise ValueError(
@@ -319,62 +385,127 @@ class NlsModelEvaluator(object):
     def energy(self, psi):
         """Compute the Gibbs free energy.
         Not really a norm, but a good measure for our purposes here.
+
+        For a block psi of shape (n, k), the energies of all columns are
+        returned.
         """
         if self.mesh.control_volumes is None:
             self.mesh.compute_control_volumes(variant=self.cv_variant)
-        alpha = -self.inner_product(psi ** 2, psi ** 2)
-        return alpha.real / self.mesh.control_volumes.sum()
+        # -<psi^2, psi^2> = -int |psi|^4
+        abs2 = psi.real ** 2 + psi.imag ** 2
+        alpha = -numpy.dot(self.mesh.control_volumes, abs2 ** 2)
+        return alpha / self.mesh.control_volumes.sum()
+
+    def _get_control_volumes(self, dtype=complex):
+        """Returns the control volumes in the real precision corresponding to
+        dtype.
+        """
+        if self.mesh.control_volumes is None:
+            self.mesh.compute_control_volumes(variant=self.cv_variant)
+        real_dtype = numpy.finfo(dtype).dtype
+        return self.mesh.control_volumes.astype(real_dtype, copy=False)
 
-    def _get_keo(self, mu):
-        """Assemble the kinetic energy operator."""
+    def _get_keo(self, mu, dtype=complex):
+        """Assemble the kinetic energy operator. For other dtypes than
+        complex128, a copy of it in that precision is cached as well.
+        """
 
         if self._keo_cache is None or self._keo_cache_mu != mu:
-            # Create the matrix structure.
-            num_nodes = len(self.mesh.node_coords)
-
             mvp_edge_cache = self._build_mvp_edge_cache(mu)
 
-            edge = self.mesh.idx_hierarchy.reshape(2, -1)
             alpha = self.mesh.ce_ratios.reshape(-1)
             alphaExp0 = alpha * numpy.exp(1j * mvp_edge_cache.reshape(-1))
-
-            row = numpy.concatenate([edge[0], edge[0], edge[1], edge[1]])
-            col = numpy.concatenate([edge[0], edge[1], edge[0], edge[1]])
             data = numpy.concatenate([alpha, -alphaExp0.conj(), -alphaExp0, alpha])
 
+            # Sum up the contributions to each matrix entry; the structure
+            # doesn't change with mu or the field, so only the data has to
+            # be computed.
+            entry, indices, indptr = self._get_keo_structure()
+            n = len(indices)
+            data = numpy.bincount(entry, weights=data.real, minlength=n) + 1j * (
+                numpy.bincount(entry, weights=data.imag, minlength=n)
+            )
+            num_nodes = len(self.mesh.node_coords)
             self._keo_cache = sparse.csr_matrix(
-                (data, (row, col)), (num_nodes, num_nodes)
+                (data, indices, indptr), (num_nodes, num_nodes)
             )
-            # transform the matrix into the more efficient CSR format
             self._keo_cache_mu = mu
-        return self._keo_cache
+            self._keo_cache_lowprec = {}
+        if numpy.dtype(dtype) == self._keo_cache.dtype:
+            return self._keo_cache
+        dtype = numpy.dtype(dtype)
+        if dtype not in self._keo_cache_lowprec:
+            self._keo_cache_lowprec[dtype] = self._keo_cache.astype(dtype)
+        return self._keo_cache_lowprec[dtype]
+
+    def _get_keo_structure(self):
+        """Returns the CSR structure (indices, indptr) of the KEO, and for
+        each of the contributions [alpha, -alphaExp0.conj(), -alphaExp0,
+        alpha] in :meth:`_get_keo`, the index of the entry it goes to.
+        """
+        if self._keo_structure is None:
+            num_nodes = len(self.mesh.node_coords)
+            edge = self.mesh.idx_hierarchy.reshape(2, -1).astype(numpy.int64)
+            row = numpy.concatenate([edge[0], edge[0], edge[1], edge[1]])
+            col = numpy.concatenate([edge[0], edge[1], edge[0], edge[1]])
+            keys, entry = numpy.unique(row * num_nodes + col, return_inverse=True)
+            indptr = numpy.zeros(num_nodes + 1, dtype=int)
+            numpy.cumsum(
+                numpy.bincount(keys // num_nodes, minlength=num_nodes), out=indptr[1:]
+            )
+            self._keo_structure = (entry, keys % num_nodes, indptr)
+        return self._keo_structure
 
     def _build_mvp_edge_cache(self, mu):
         """Builds the cache for the magnetic vector potential."""
-        # Approximate the integral
-        #
-        #    I = \int_{x0}^{xj} (xj-x0)/|xj-x0| . A(x) dx
-        #
-        # numerically by the midpoint rule, i.e.,
-        #
-        #    I ~ (xj-x0) . A( 0.5*(xj+x0) )
-        #      ~ (xj-x0) . 0.5*( A(xj) + A(x0) )
-        #
-        # The following computes the dot-products of all those
-        # edges[i], mvp[i], and put the result in the cache.
-        half_edges = (
-            self.mesh.node_coords[self.mesh.idx_hierarchy[1]]
-            - self.mesh.node_coords[self.mesh.idx_hierarchy[0]]
-        )
-        mvp = 0.5 * (
-            self._get_mvp(mu, self.mesh.idx_hierarchy[1])
-            + self._get_mvp(mu, self.mesh.idx_hierarchy[0])
+        # The edge integrals scale with mu, so they are computed only once
+        # (for each field direction).
+        if self._edge_integral_cache is None:
+            A = self._raw_magnetic_vector_potential
+            if self._field_direction is None:
+                self._edge_integral_cache = self._get_edge_integrals(A)
+            else:
+                if self._edge_integral_basis is None:
+                    self._edge_integral_basis = numpy.array(
+                        [self._get_edge_integrals(a) for a in A]
+                    )
+                self._edge_integral_cache = numpy.tensordot(
+                    self._field_direction, self._edge_integral_basis, 1
+                )
+        return mu * self._edge_integral_cache
+
+    def _get_edge_integrals(self, A):
+        """Returns the integrals
+
+           I = \\int_{x0}^{xj} (xj-x0)/|xj-x0| . A(x) dx
+
+        for all half-edges. They are computed once per edge (and flipped for
+        the half-edges in opposite direction), either by the given callable,
+        or, for nodal values of A, approximately by the trapezoidal rule,
+
+           I ~ (xj-x0) . 0.5*( A(xj) + A(x0) ).
+        """
+        num_nodes = len(self.mesh.node_coords)
+        half_edges = self.mesh.idx_hierarchy.reshape(2, -1)
+        is_flipped = half_edges[0] > half_edges[1]
+        lo = numpy.where(is_flipped, half_edges[1], half_edges[0]).astype(numpy.int64)
+        hi = numpy.where(is_flipped, half_edges[0], half_edges[1]).astype(numpy.int64)
+        _, idx, inv = numpy.unique(
+            lo * num_nodes + hi, return_index=True, return_inverse=True
         )
+        edges = numpy.array([lo[idx], hi[idx]])
 
-        return numpy.sum(half_edges * mvp, -1)
+        X = self.mesh.node_coords
+        if callable(A):
+            integrals = A(X[edges[0]], X[edges[1]])
+        else:
+            integrals = numpy.sum(
+                (X[edges[1]] - X[edges[0]]) * 0.5 * (A[edges[1]] + A[edges[0]]), -1
+            )
 
-    def _get_mvp(self, mu, index):
-        return mu * self._raw_magnetic_vector_potential[index]
+        integrals = integrals[inv]
+        integrals[is_flipped] *= -1
+        return integrals.reshape(self.mesh.idx_hierarchy.shape[1:])
 
     # def keo_smallest_eigenvalue_approximation(self):
     #     '''Returns
@@ -423,3 +554,215 @@ class NlsModelEvaluator(object):
     #         k += 1
 
     #     return sum / len(self.mesh.nodes)
+
+
+class Linearization(object):
+    """Residual, Jacobian and preconditioners of a :class:`NlsModelEvaluator`
+    at a fixed state x. :math:`|x|^2` is computed only once for all of them,
+    and each quantity is only computed when it's first requested (per
+    dtype).
+    """
+
+    def __init__(self, modeleval, x, mu, g):
+        self.modeleval = modeleval
+        self.x = x
+        self.mu = mu
+        self.g = g
+        self.abs2 = x.real ** 2 + x.imag ** 2
+        self._F = None
+        self._operators = {}
+        return
+
+    @property
+    def F(self):
+        if self._F is None:
+            self._F = self.modeleval.compute_f(self.x, self.mu, self.g, abs2=self.abs2)
+        return self._F
+
+    def _get(self, name, dtype):
+        key = (name, dtype)
+        if key not in self._operators:
+            self._operators[key] = getattr(self.modeleval, name)(
+                self.x, self.mu, self.g, abs2=self.abs2, dtype=dtype
+            )
+        return self._operators[key]
+
+    def get_jacobian(self, dtype=None):
+        return self._get("get_jacobian", dtype)
+
+    def get_preconditioner(self, dtype=None):
+        return self._get("get_preconditioner", dtype)
+
+    def get_preconditioner_inverse(self, dtype=None):
+        return self._get("get_preconditioner_inverse", dtype)
+
+
+class ScaledNlsModelEvaluator(object):
+    """Nonlinear Schrödinger in the variables :math:`y = D^{1/2}\\psi` where
+    D is the diagonal matrix of control volumes. The residual becomes
+
+    .. math::
+        D^{1/2} GP(D^{-1/2} y)
+        = D^{-1/2} K D^{-1/2} y + (V + g D^{-1} |y|^2) y,
+
+    and the natural inner product of the original problem turns into the
+    (real part of the) Euclidean inner product, so Krylov solvers don't need
+    to apply D in every inner product.
+    """
+
+    def __init__(self, modeleval):
+        """Initialization.
+        """
+        self.modeleval = modeleval
+        self.dtype = modeleval.dtype
+        mesh = modeleval.mesh
+        if mesh.control_volumes is None:
+            mesh.compute_control_volumes(variant=modeleval.cv_variant)
+        self._sqrt_cv = numpy.sqrt(mesh.control_volumes)
+        self._keo_cache = None
+        self._keo_cache_source = None
+        self._keo_cache_lowprec = {}
+        return
+
+    def _reshape(self, a, x):
+        return a.reshape((x.shape[0],) + (1,) * (len(x.shape) - 1))
+
+    def _get_sqrt_cv(self, x):
+        """Returns the square roots of the control volumes in the real
+        precision of x, shaped to broadcast over the columns of x.
+        """
+        real_dtype = numpy.finfo(x.dtype).dtype
+        return self._reshape(self._sqrt_cv.astype(real_dtype, copy=False), x)
+
+    def scale(self, x):
+        """Transforms a state of the original problem into the scaled
+        variables.
+        """
+        return self._get_sqrt_cv(x) * x
+
+    def unscale(self, y):
+        """Transforms a state in the scaled variables back.
+        """
+        return y / self._get_sqrt_cv(y)
+
+    def _get_keo(self, mu, dtype=complex):
+        """Returns :math:`D^{-1/2} K D^{-1/2}`.
+        """
+        # Rebuild whenever the original KEO was (for another mu or field).
+        keo = self.modeleval._get_keo(mu)
+        if keo is not self._keo_cache_source:
+            n = len(self._sqrt_cv)
+            D = sparse.spdiags(1.0 / self._sqrt_cv, [0], n, n)
+            self._keo_cache = sparse.csr_matrix(D * keo * D)
+            self._keo_cache_source = keo
+            self._keo_cache_lowprec = {}
+        if numpy.dtype(dtype) == self._keo_cache.dtype:
+            return self._keo_cache
+        dtype = numpy.dtype(dtype)
+        if dtype not in self._keo_cache_lowprec:
+            self._keo_cache_lowprec[dtype] = self._keo_cache.astype(dtype)
+        return self._keo_cache_lowprec[dtype]
+
+    def _get_alpha(self, y, g, abs2):
+        """Returns g |x|^2 in terms of y.
+        """
+        if abs2 is None:
+            abs2 = y.real ** 2 + y.imag ** 2
+        return g * abs2 / self._reshape(self._sqrt_cv ** 2, y)
+
+    def compute_f(self, y, mu, g, abs2=None):
+        """Computes the scaled residual. As for
+        :meth:`NlsModelEvaluator.compute_f`, y may be a block of states.
+        """
+        V = self._reshape(self.modeleval._V, y)
+        return self._get_keo(mu) * y + (V + self._get_alpha(y, g, abs2)) * y
+
+    def linearize(self, y, mu, g):
+        """See :meth:`NlsModelEvaluator.linearize`.
+        """
+        return Linearization(self, y, mu, g)
+
+    def get_jacobian(self, y, mu, g, abs2=None, dtype=None):
+        """Returns the Jacobian
+        :math:`\\varphi \\mapsto D^{1/2} J(D^{-1/2} y) D^{-1/2} \\varphi`.
+        """
+
+        def _apply_jacobian(phi):
+            shape = (phi.shape[0],) + (1,) * (len(phi.shape) - 1)
+            return (
+                keo * phi
+                + alpha.reshape(shape) * phi
+                + beta.reshape(shape) * phi.conj()
+            )
+
+        if dtype is None:
+            dtype = self.dtype
+        keo = self._get_keo(mu, dtype)
+        alpha = self._reshape(self.modeleval._V, y) + 2.0 * self._get_alpha(y, g, abs2)
+        alpha = alpha.astype(dtype)
+        beta = (g * y ** 2 / self._reshape(self._sqrt_cv ** 2, y)).astype(dtype)
+        num_unknowns = len(self._sqrt_cv)
+        return krypy.utils.LinearOperator(
+            (num_unknowns, num_unknowns),
+            dtype,
+            dot=_apply_jacobian,
+            dot_adj=_apply_jacobian,
+        )
+
+    def get_preconditioner(self, y, mu, g, abs2=None, dtype=None):
+        """Returns the scaled preconditioner
+        :math:`D^{-1/2} K D^{-1/2} + 2g D^{-1}|y|^2`.
+        """
+        if self.modeleval._preconditioner_type == "none":
+            return None
+
+        def _apply_precon(phi):
+            return keo * phi + self._reshape(alpha, phi) * phi
+
+        if dtype is None:
+            dtype = self.dtype
+        keo = self._get_keo(mu, dtype)
+        real_dtype = numpy.finfo(dtype).dtype
+        if g > 0.0:
+            alpha = (2.0 * self._get_alpha(y, g, abs2)).astype(real_dtype)
+        else:
+            alpha = numpy.zeros(len(y), dtype=real_dtype)
+        num_unknowns = len(self._sqrt_cv)
+        return krypy.utils.LinearOperator(
+            (num_unknowns, num_unknowns), dtype, dot=_apply_precon
+        )
+
+    def get_preconditioner_inverse(self, y, mu, g, abs2=None, dtype=None):
+        """Returns :math:`D^{1/2} M^{-1} D^{-1/2}` with M^{-1} the AMG
+        preconditioner of the original problem.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        Minv = self.modeleval.get_preconditioner_inverse(
+            self.unscale(y),
+            mu,
+            g,
+            abs2=None if abs2 is None else abs2 / self._reshape(self._sqrt_cv ** 2, y),
+            dtype=dtype,
+        )
+        if Minv is None:
+            return None
+
+        def _apply_inverse_prec(phi):
+            return self.scale(Minv * self.unscale(phi))
+
+        num_unknowns = len(self._sqrt_cv)
+        return krypy.utils.LinearOperator(
+            (num_unknowns, num_unknowns), dtype, dot=_apply_inverse_prec
+        )
+
+    def inner_product(self, phi0, phi1):
+        """The natural inner product of the original problem, i.e., the real
+        part of the Euclidean inner product in the scaled variables.
+        """
+        assert phi0.shape[0] == phi1.shape[0], (
+            "Input vectors not matching.",
+            phi0.shape,
+            phi1.shape,
+        )
+        return numpy.dot(phi0.real.T, phi1.real) + numpy.dot(phi0.imag.T, phi1.imag)
@@ -2,6 +2,11 @@
 """
 Collection of numerical algorithms.
 """
+import collections
+import hashlib
+import time
+import tracemalloc
+
 import numpy
 import krypy
 
@@ -57,6 +62,814 @@ class Forcing_EW2(object):
         return eta
 
 
+class ForcingCostAware(object):
+    """Chooses eta in each step such that the predicted time to reach
+    `nonlinear_tol` is minimal. The prediction is based on the measured
+
+      * time per Krylov iteration and mean Krylov convergence factor
+        :math:`\\rho`, i.e., a solve to tolerance eta takes about
+        :math:`\\log\\eta / \\log\\rho` iterations,
+      * time per Newton step apart from the linear solve (residual
+        evaluation, setup of the Jacobian and the preconditioner),
+
+    and the local convergence model
+    :math:`\\|F_{k+1}\\| \\approx \\eta\\|F_k\\| + C\\|F_k\\|^2` where C is
+    estimated from the previous step. The candidates are `num_candidates`
+    logarithmically spaced values in [eta_min, eta_max]. Each choice is
+    recorded in `choices`.
+    """
+
+    def __init__(
+        self, nonlinear_tol, eta_min=1.0e-10, eta_max=1.0e-1, num_candidates=19
+    ):
+        self.nonlinear_tol = nonlinear_tol
+        self.eta_min = eta_min
+        self.eta_max = eta_max
+        self.candidates = numpy.logspace(
+            numpy.log10(eta_min), numpy.log10(eta_max), num_candidates
+        )
+        self.choices = []
+        self._time_per_iteration = None
+        self._time_overhead = None
+        self._rho = None
+        return
+
+    def get_initial(self, F0):
+        """Without any measurements, a loose first solve is the cheapest way
+        to get them.
+        """
+        self.choices.append({"eta": self.eta_max})
+        return self.eta_max
+
+    def observe(self, info):
+        """Takes the timings of a Newton step (as passed to newton()'s
+        callback).
+        """
+        num_iter = max(info["num_linear_iter"], 1)
+        self._time_per_iteration = info["linear_time"] / num_iter
+        self._time_overhead = max(info["step_time"] - info["linear_time"], 0.0)
+        relres = max(info["linear_relres"], 1.0e-16)
+        self._rho = min(max(relres ** (1.0 / num_iter), 1.0e-3), 0.99)
+        return
+
+    def _predict_time(self, eta, F0, C):
+        """Predicted time to reach the tolerance with eta in all steps.
+        """
+        num_iter = numpy.ceil(numpy.log(eta) / numpy.log(self._rho))
+        step_time = self._time_overhead + num_iter * self._time_per_iteration
+        r = F0
+        num_steps = 0
+        while r > self.nonlinear_tol:
+            r = eta * r + C * r ** 2
+            num_steps += 1
+            if num_steps > 100 or r >= F0:
+                return numpy.inf, num_steps
+        return num_steps * step_time, num_steps
+
+    def get(self, eta_previous, resval_previous, F0, F_1):
+        if self._rho is None:
+            return self.get_initial(F0)
+        # F0 ~ resval_previous * F_1 + C * F_1**2
+        C = max(F0 - resval_previous * F_1, 0.0) / F_1 ** 2
+        predictions = [self._predict_time(eta, F0, C) for eta in self.candidates]
+        k = numpy.argmin([p[0] for p in predictions])
+        eta = self.candidates[k]
+        if not numpy.isfinite(predictions[k][0]):
+            # The model doesn't predict convergence; be careful.
+            eta = self.eta_min
+        self.choices.append(
+            {
+                "eta": eta,
+                "predicted_time": predictions[k][0],
+                "predicted_num_steps": predictions[k][1],
+                "time_per_linear_iteration": self._time_per_iteration,
+                "time_overhead": self._time_overhead,
+                "linear_convergence_factor": self._rho,
+                "C": C,
+            }
+        )
+        return eta
+
+
+def _get_eta(forcing_term, k, eta0, eta_previous, linear_relres, Fx_norms):
+    if k == 0:
+        if hasattr(forcing_term, "get_initial"):
+            return forcing_term.get_initial(Fx_norms[-1])
+        return eta0
+    return forcing_term.get(eta_previous, linear_relres, Fx_norms[-1], Fx_norms[-2])
+
+
+def _observe(forcing_term, info):
+    if hasattr(forcing_term, "observe"):
+        forcing_term.observe(info)
+    return
+
+
+class FullStep(object):
+    """Always take the full Newton step.
+    """
+
+    def step(self, x, dx, Fx, Fx_norm, eta, jacobian, compute_f, inner_product):
+        x += dx
+        Fx = compute_f(x)
+        Fx_norm = numpy.sqrt(inner_product(Fx, Fx))
+        return x, Fx, Fx_norm, {"step_length": 1.0, "num_f_evals": 1}
+
+
+class LineSearch(object):
+    """Backtracking line search on the residual norm :math:`\\|F\\|` with
+    safeguarded quadratic interpolation. A step length t is accepted if
+
+    .. math::
+        \\|F(x + t\\delta x)\\| \\leq (1 - \\alpha t (1-\\eta)) \\|F(x)\\|.
+
+    See
+    "Globally Convergent Inexact Newton Methods (1994)"
+    -- Eisenstat, Walker
+    """
+
+    def __init__(self, alpha=1.0e-4, theta_min=0.1, theta_max=0.5, min_step=1.0e-4):
+        self.alpha = alpha
+        self.theta_min = theta_min
+        self.theta_max = theta_max
+        self.min_step = min_step
+        return
+
+    def step(self, x, dx, Fx, Fx_norm, eta, jacobian, compute_f, inner_product):
+        t = 1.0
+        num_f_evals = 0
+        while True:
+            x_new = x + t * dx
+            Fx_new = compute_f(x_new)
+            Fx_new_norm = numpy.sqrt(inner_product(Fx_new, Fx_new))
+            num_f_evals += 1
+            if Fx_new_norm <= (1.0 - self.alpha * t * (1.0 - eta)) * Fx_norm:
+                return (
+                    x_new,
+                    Fx_new,
+                    Fx_new_norm,
+                    {"step_length": t, "num_f_evals": num_f_evals},
+                )
+            if numpy.isfinite(Fx_new_norm):
+                # Minimize the quadratic model of ||F(x + t dx)||^2, but don't
+                # shrink the step too much or too little.
+                f0 = Fx_norm ** 2
+                t_min = f0 * t ** 2 / (Fx_new_norm ** 2 - f0 + 2 * f0 * t)
+                t = min(max(t_min, self.theta_min * t), self.theta_max * t)
+            else:
+                t *= self.theta_min
+            if t < self.min_step:
+                return (
+                    x,
+                    Fx,
+                    Fx_norm,
+                    {"step_length": 0.0, "num_f_evals": num_f_evals},
+                )
+
+
+class DoglegTrustRegion(object):
+    """Trust region globalization on :math:`\\|F\\|^2` with the dogleg path
+    between the Cauchy point and the (inexact) Newton step.
+
+    The initial radius defaults to the length of the first Newton step.
+    """
+
+    def __init__(
+        self, radius0=None, max_radius=numpy.inf, accept=1.0e-4, max_trials=10
+    ):
+        self.radius = radius0
+        self.max_radius = max_radius
+        self.accept = accept
+        self.max_trials = max_trials
+        return
+
+    def step(self, x, dx, Fx, Fx_norm, eta, jacobian, compute_f, inner_product):
+        dx_norm = numpy.sqrt(inner_product(dx, dx))
+        if self.radius is None:
+            self.radius = dx_norm
+
+        # Steepest descent direction of 1/2 ||F||^2 is J^* F = J F since J is
+        # self-adjoint with respect to the inner product. Get the Cauchy point
+        # of the linear model along it.
+        grad = jacobian * Fx
+        Jgrad = jacobian * grad
+        grad_norm2 = inner_product(grad, grad)
+        Jgrad_norm2 = inner_product(Jgrad, Jgrad)
+        if Jgrad_norm2 > 0.0:
+            p_cauchy = -grad_norm2 / Jgrad_norm2 * grad
+        else:
+            p_cauchy = numpy.zeros(dx.shape, dtype=dx.dtype)
+        p_cauchy_norm = numpy.sqrt(inner_product(p_cauchy, p_cauchy))
+
+        for k in range(self.max_trials):
+            if dx_norm <= self.radius:
+                p = dx
+                t = 1.0
+            elif p_cauchy_norm >= self.radius:
+                p = self.radius / p_cauchy_norm * p_cauchy
+                t = self.radius / dx_norm
+            else:
+                # Find tau such that ||p_cauchy + tau (dx - p_cauchy)|| = radius.
+                d = dx - p_cauchy
+                a = inner_product(d, d)
+                b = inner_product(p_cauchy, d)
+                c = p_cauchy_norm ** 2 - self.radius ** 2
+                tau = (-b + numpy.sqrt(b ** 2 - a * c)) / a
+                p = p_cauchy + tau * d
+                t = self.radius / dx_norm
+
+            x_new = x + p
+            Fx_new = compute_f(x_new)
+            Fx_new_norm = numpy.sqrt(inner_product(Fx_new, Fx_new))
+
+            linear_res = Fx + jacobian * p
+            predicted = Fx_norm ** 2 - inner_product(linear_res, linear_res)
+            actual = Fx_norm ** 2 - Fx_new_norm ** 2
+            rho = actual / predicted if predicted > 0.0 else -1.0
+
+            # Update the trust region radius.
+            p_norm = numpy.sqrt(inner_product(p, p))
+            if rho < 0.25:
+                self.radius = 0.25 * p_norm
+            elif rho > 0.75 and p_norm >= 0.99 * self.radius:
+                self.radius = min(2.0 * self.radius, self.max_radius)
+
+            if rho > self.accept:
+                return (
+                    x_new,
+                    Fx_new,
+                    Fx_new_norm,
+                    {"step_length": t, "num_f_evals": k + 1, "radius": self.radius},
+                )
+
+        return (
+            x,
+            Fx,
+            Fx_norm,
+            {"step_length": 0.0, "num_f_evals": self.max_trials, "radius": self.radius},
+        )
+
+
+class Deflation(object):
+    """Deflation of known solutions :math:`r_i`: Instead of F, Newton's method
+    is applied to the deflated residual :math:`m(x) F(x)` with
+
+    .. math::
+        m(x) = \\prod_i \\left(\\frac{1}{d(x, r_i)^p} + \\sigma\\right)
+
+    which doesn't vanish at the :math:`r_i`. Since :math:`e^{i\\theta}r_i`
+    is a solution as well, the distance is measured modulo the phase,
+
+    .. math::
+        d(x, r)^2 = \\min_\\theta \\|x - e^{i\\theta}r\\|^2
+                  = \\|x\\|^2 + \\|r\\|^2 - 2|\\langle r, x\\rangle|.
+
+    The Newton step of the deflated problem is a multiple of the undeflated
+    Newton step, so the linear solves are not affected.
+
+    See
+    "Deflation Techniques for Finding Distinct Solutions of Nonlinear Partial
+    Differential Equations (2015)"
+    -- Farrell, Birkisson, Funke
+    """
+
+    def __init__(self, states, power=2, shift=1.0):
+        self.states = states
+        self.power = power
+        self.shift = shift
+        return
+
+    def get_step_factor(self, x, dx, inner_product):
+        """Returns tau such that tau*dx is the Newton step for m(x) F(x) if dx
+        is the Newton step for F(x).
+        """
+        # Compute the directional derivative of log(m) in direction dx.
+        x_norm2 = inner_product(x, x)
+        dlogm = 0.0
+        for r in self.states:
+            r = r.reshape(x.shape)
+            # <r, x> = a + ib with a = Re<r, x>, b = Re<ir, x>
+            a = inner_product(r, x)
+            b = inner_product(1j * r, x)
+            abs_rx = numpy.sqrt(a ** 2 + b ** 2)
+            d2 = max(x_norm2 + inner_product(r, r) - 2 * abs_rx, 0.0)
+            if d2 == 0.0:
+                # x is one of the deflated states; m(x) F(x) is infinite.
+                return 0.0
+            if abs_rx > 0.0:
+                da = inner_product(r, dx)
+                db = inner_product(1j * r, dx)
+                dabs_rx = (a * da + b * db) / abs_rx
+            else:
+                dabs_rx = 0.0
+            dd2 = 2 * inner_product(x, dx) - 2 * dabs_rx
+            # m_i = d2^(-p/2) + shift; the derivative of log(m_i) is computed
+            # with d2^(p/2) m_i such that it doesn't overflow for small d2.
+            scaled_m_i = 1.0 + self.shift * d2 ** (0.5 * self.power)
+            dlogm -= 0.5 * self.power * dd2 / (d2 * scaled_m_i)
+        return 1.0 / (1.0 - dlogm)
+
+
+def _get_globalization(globalization):
+    if globalization is None:
+        return FullStep()
+    elif globalization == "line search":
+        return LineSearch()
+    elif globalization == "dogleg":
+        return DoglegTrustRegion()
+    return globalization
+
+
+class DivergenceDetector(object):
+    """Detects hopeless Newton runs. A run is considered hopeless if
+
+      * the residual norm was reduced by less than a factor of `min_reduction`
+        over the last `window` steps,
+      * the residual norm grew by a factor of more than `max_growth` over the
+        smallest residual norm so far,
+      * the Krylov solver hit its maximum number of iterations
+        `max_krylov_failures` times, or
+      * :math:`\\max|x|` grew by a factor of more than `max_abs_growth`
+        (relative to the initial guess or 1, whatever is larger).
+    """
+
+    def __init__(
+        self,
+        window=5,
+        min_reduction=0.5,
+        max_growth=1.0e3,
+        max_krylov_failures=2,
+        max_abs_growth=10.0,
+    ):
+        self.window = window
+        self.min_reduction = min_reduction
+        self.max_growth = max_growth
+        self.max_krylov_failures = max_krylov_failures
+        self.max_abs_growth = max_abs_growth
+        self._max_abs0 = None
+        return
+
+    def begin(self, x0):
+        self._max_abs0 = max(numpy.max(abs(x0)), 1.0)
+        return
+
+    def check(self, Fx_norms, x, num_krylov_failures):
+        """Returns the reason for stopping, or None if the run looks fine.
+        """
+        if num_krylov_failures >= self.max_krylov_failures:
+            return "divergence: Krylov failures"
+        if numpy.max(abs(x)) > self.max_abs_growth * self._max_abs0:
+            return "divergence: state blow-up"
+        if Fx_norms[-1] > self.max_growth * min(Fx_norms):
+            return "divergence: residual growth"
+        if (
+            len(Fx_norms) > self.window
+            and Fx_norms[-1] > self.min_reduction * Fx_norms[-1 - self.window]
+        ):
+            return "divergence: stagnation"
+        return None
+
+
+class QuasiNewton(object):
+    """Reuses the Jacobian and the preconditioners of an earlier Newton step
+    and corrects the Jacobian with Powell-symmetric-Broyden updates
+
+    .. math::
+        B_+ = B + \\frac{r s^* + s r^*}{\\langle s, s\\rangle}
+        - \\frac{\\langle r, s\\rangle}{\\langle s, s\\rangle^2} s s^*,
+        \\quad r = \\Delta F - B s,\\quad s = \\Delta x,
+
+    where :math:`s^*` is the functional :math:`\\langle s, \\cdot\\rangle` of
+    the (real) inner product of the problem. The updates keep B self-adjoint,
+    so MINRES can still be used. Jacobian and preconditioners are rebuilt if
+    the last step reduced the residual norm by less than a factor of
+    `min_reduction`, or after `max_updates` updates.
+    """
+
+    def __init__(self, max_updates=5, min_reduction=0.5):
+        self.max_updates = max_updates
+        self.min_reduction = min_reduction
+        self.begin()
+        return
+
+    def begin(self):
+        """Forgets about the operators of a previous run.
+        """
+        self.num_refreshes = 0
+        self._jacobian = None
+        self._M = None
+        self._Minv = None
+        self._dtype = None
+        self._updates = []
+        self._x = None
+        self._Fx = None
+        return
+
+    def get_operators(self, linearizer, x, Fx, dtype, Fx_norms):
+        """Returns the Jacobian (with updates), the preconditioner and its
+        inverse at the current iterate x, rebuilding them via `linearizer`
+        if necessary.
+        """
+        self._x = x.copy()
+        self._Fx = Fx
+        if (
+            self._jacobian is None
+            or dtype != self._dtype
+            or len(self._updates) >= self.max_updates
+            or Fx_norms[-1] > self.min_reduction * Fx_norms[-2]
+        ):
+            self._jacobian, self._M, self._Minv = linearizer.get_operators(x, dtype)
+            self._dtype = dtype
+            self._updates = []
+            self.num_refreshes += 1
+        return self._get_jacobian(), self._M, self._Minv
+
+    def _get_jacobian(self):
+        if not self._updates:
+            return self._jacobian
+        jacobian = self._jacobian
+        updates = list(self._updates)
+
+        def _apply(phi):
+            y = jacobian * phi
+            for r, s, ss, rs, ip in updates:
+                s_phi = ip(s, phi)
+                y = y + (r * s_phi + s * ip(r, phi)) / ss - (rs / ss ** 2) * s * s_phi
+            return y
+
+        return krypy.utils.LinearOperator(
+            jacobian.shape, jacobian.dtype, dot=_apply, dot_adj=_apply
+        )
+
+    def update(self, x, Fx, inner_product):
+        """Adds the secant update for the step from the iterate passed to
+        :meth:`get_operators` to x. `inner_product` must accept blocks of
+        vectors. Returns the number of updates the step was computed with.
+        """
+        num_updates = len(self._updates)
+        dx = x - self._x
+        ss = inner_product(dx, dx)[0, 0]
+        if ss > 0.0:
+            r = Fx - self._Fx - self._get_jacobian() * dx
+            rs = inner_product(r, dx)[0, 0]
+            self._updates.append((r, dx, ss, rs, inner_product))
+        self._x = None
+        self._Fx = None
+        return num_updates
+
+
+def _get_operators(linearizer, quasi_newton, x, Fx, dtype, Fx_norms):
+    if quasi_newton is None:
+        return linearizer.get_operators(x, dtype)
+    return quasi_newton.get_operators(linearizer, x, Fx, dtype, Fx_norms)
+
+
+def _get_quasi_newton(quasi_newton):
+    if quasi_newton is None or quasi_newton is False:
+        return None
+    if quasi_newton is True:
+        return QuasiNewton()
+    quasi_newton.begin()
+    return quasi_newton
+
+
+class _DeflationVectors(object):
+    """Deflation vectors computed ahead of a solve. Stands in for both the
+    recycling solver's last solver and the vector factory.
+    """
+
+    def __init__(self, U):
+        self.U = U
+        return
+
+    def get(self, solver):
+        return self.U
+
+
+def _get_vector_factory(vector_factory_generator, x, recycling_solver):
+    """Returns the vector factory for the next solve of `recycling_solver` and
+    drops its last solver, which holds on to the previous linear system and
+    thereby its Jacobian and preconditioner. If vectors are recycled from it,
+    they are computed first; the returned vector factory then provides them.
+    """
+    vector_factory = None
+    if vector_factory_generator is not None:
+        vector_factory = vector_factory_generator(x)
+    last_solver = recycling_solver.last_solver
+    if last_solver is None:
+        return vector_factory
+    if isinstance(last_solver, _DeflationVectors):
+        # the solve that should have replaced it failed
+        return last_solver
+    if vector_factory is None:
+        if getattr(recycling_solver, "_vector_factory", None) is not None:
+            # the solver recycles on its own
+            return None
+        vectors = None
+    else:
+        vectors = _DeflationVectors(vector_factory.get(last_solver))
+    _release_solver(last_solver)
+    recycling_solver.last_solver = vectors
+    return vectors
+
+
+def _release_solver(solver):
+    """Drops everything but the result of a solver, including its linear system.
+    krypy's deflated solvers and timed linear systems reference themselves, so
+    they would otherwise only be freed (along with the Jacobian and the
+    preconditioner) by the garbage collector.
+    """
+    vars(solver.linear_system).clear()
+    xk, resnorms = solver.xk, solver.resnorms
+    vars(solver).clear()
+    solver.xk = xk
+    solver.resnorms = resnorms
+    return
+
+
+def _krylov_solve(
+    recycling_solver, linear_system, vector_factory, eta, kwargs, tolerate_failure
+):
+    """Solves the linear system. Returns the solver and whether it failed to
+    converge; the latter only if `tolerate_failure`, else the ConvergenceError
+    is raised.
+    """
+    try:
+        out = recycling_solver.solve(linear_system, vector_factory, tol=eta, **kwargs)
+    except krypy.utils.ConvergenceError as e:
+        if not tolerate_failure:
+            raise
+        # The recycling solver keeps its previous last solver.
+        _release_solver(e.solver)
+        return e.solver, True
+    return out, False
+
+
+def _check_step(step_info, divergence_detector, Fx_norms, x, num_krylov_failures):
+    """Returns the reason for stopping Newton's method after a step, or None.
+    """
+    if step_info["step_length"] == 0.0:
+        return "globalization failure"
+    if divergence_detector is not None:
+        return divergence_detector.check(Fx_norms, x, num_krylov_failures)
+    return None
+
+
+class _Linearizer(object):
+    """Evaluates F and, at the same state, the Jacobian and the
+    preconditioners. If the model evaluator provides `linearize()`, the
+    linearization created for the last F evaluation is reused for the
+    operators such that the work shared between them is done only once.
+    """
+
+    def __init__(self, model_evaluator, args):
+        self.model_evaluator = model_evaluator
+        self.args = args
+        self._linearization = None
+        return
+
+    def compute_f(self, x):
+        if not hasattr(self.model_evaluator, "linearize"):
+            return self.model_evaluator.compute_f(x, **self.args)
+        self._linearization = self.model_evaluator.linearize(x, **self.args)
+        return self._linearization.F
+
+    def get_operators(self, x, dtype=None):
+        """Returns the Jacobian, the preconditioner and its inverse at x. If
+        dtype is given, the operators are requested in that precision.
+        """
+        lin = self._linearization
+        self._linearization = None
+        if lin is None or lin.x is not x:
+            if not hasattr(self.model_evaluator, "linearize"):
+                me = self.model_evaluator
+                args = dict(self.args)
+                if dtype is not None:
+                    args["dtype"] = dtype
+                return (
+                    me.get_jacobian(x, **args),
+                    me.get_preconditioner(x, **args),
+                    me.get_preconditioner_inverse(x, **args),
+                )
+            lin = self.model_evaluator.linearize(x, **self.args)
+        return (
+            lin.get_jacobian(dtype=dtype),
+            lin.get_preconditioner(dtype=dtype),
+            lin.get_preconditioner_inverse(dtype=dtype),
+        )
+
+
+def _get_linear_dtype(eta, single_precision_eta):
+    """Returns the dtype in which the linear system for the forcing term eta
+    is solved (None for the model evaluator's default).
+    """
+    if single_precision_eta is not None and eta > single_precision_eta:
+        return numpy.complex64
+    return None
+
+
+def _scale_problem(model_evaluator, x0, deflation):
+    """Returns the scaled model evaluator, initial guess and deflation.
+    """
+    model_evaluator = model_evaluator.get_scaled()
+    x0 = model_evaluator.scale(x0)
+    if deflation is not None:
+        deflation = Deflation(
+            [model_evaluator.scale(state) for state in deflation.states],
+            power=deflation.power,
+            shift=deflation.shift,
+        )
+    return model_evaluator, x0, deflation
+
+
+class _StepMemory(object):
+    """Measures the peak memory allocated within each Newton step (on top of
+    what is in use at its beginning) with tracemalloc. Reports None if not
+    `enabled`, or if tracemalloc was already tracing and its peak can't be
+    reset (Python < 3.9).
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self._owner = enabled and not tracemalloc.is_tracing()
+        self._running = False
+        return
+
+    def begin(self):
+        if not self.enabled:
+            return
+        if self._owner:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:
+            self.enabled = False
+            return
+        self._running = True
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return
+
+    def end(self):
+        if not self._running:
+            return None
+        peak = tracemalloc.get_traced_memory()[1]
+        self.stop()
+        return peak - self._baseline
+
+    def stop(self):
+        if self._running and self._owner:
+            tracemalloc.stop()
+        self._running = False
+        return
+
+
+class _NewtonHistory(object):
+    """The convergence history of Newton's method in arrays preallocated for
+    `maxiter` steps. Of the linear residual histories, only the last
+    `max_linear_histories` are kept (all if None).
+    """
+
+    def __init__(self, Fx_norm0, maxiter, max_linear_histories):
+        self.k = 0
+        self._Fx_norms = numpy.empty(maxiter + 1)
+        self._Fx_norms[0] = Fx_norm0
+        self._etas = numpy.empty(maxiter)
+        self._step_lengths = numpy.empty(maxiter)
+        self._num_linear_iter = numpy.empty(maxiter, dtype=int)
+        self._peak_memory = numpy.empty(maxiter)
+        self._linear_relresvecs = collections.deque(maxlen=max_linear_histories)
+        return
+
+    @property
+    def Fx_norms(self):
+        return self._Fx_norms[: self.k + 1]
+
+    def add(self, info, resnorms):
+        """Records a Newton step with the given info (as passed to the
+        callback) and linear residual norms.
+        """
+        self._Fx_norms[self.k + 1] = info["Fx_norm"]
+        self._etas[self.k] = info["eta"]
+        self._step_lengths[self.k] = info["step_length"]
+        self._num_linear_iter[self.k] = info["num_linear_iter"]
+        peak_memory = info["peak_memory"]
+        self._peak_memory[self.k] = numpy.nan if peak_memory is None else peak_memory
+        self._linear_relresvecs.append(numpy.array(resnorms))
+        self.k += 1
+        return
+
+    def get(self):
+        k = self.k
+        return {
+            "Newton residuals": self._Fx_norms[: k + 1],
+            "linear relresvecs": list(self._linear_relresvecs),
+            "num linear iterations": self._num_linear_iter[:k],
+            "step lengths": self._step_lengths[:k],
+            "forcing terms": self._etas[:k],
+            "peak memory": self._peak_memory[:k],
+        }
+
+
+class _StopRequest(Exception):
+    """Raised from within a linear solve when a hook asks Newton to stop.
+    """
+
+    pass
+
+
+def _hooked_operator(A, hook, newton_step):
+    """Wraps the operator A such that `hook` is called after each application,
+    i.e., once per Krylov iteration.
+    """
+    A = krypy.utils.get_linearoperator(A.shape, A)
+    info = {"newton_step": newton_step, "num_matvecs": 0}
+    start = time.time()
+
+    def _dot(phi):
+        y = A * phi
+        info["num_matvecs"] += 1
+        info["time"] = time.time() - start
+        if hook(dict(info)):
+            raise _StopRequest()
+        return y
+
+    return krypy.utils.LinearOperator(A.shape, A.dtype, dot=_dot, dot_adj=_dot)
+
+
+class _NewtonMonitor(object):
+    """Reports the progress of Newton's method to the YAML emitter (if
+    debugging) and to the user-provided hooks.
+    """
+
+    def __init__(self, debug, yaml_emitter, callback):
+        self.callback = callback
+        self.yaml_emitter = None
+        self.owns_yaml_emitter = False
+        if debug:
+            from . import yaml
+
+            if yaml_emitter is None:
+                yaml_emitter = yaml.YamlEmitter()
+                yaml_emitter.begin_doc()
+                self.owns_yaml_emitter = True
+            yaml_emitter.begin_seq()
+            self.yaml_emitter = yaml_emitter
+        self.start = time.time()
+        self.step_start = None
+        return
+
+    def begin_step(self, k, Fx_norm):
+        self.step_start = time.time()
+        if self.yaml_emitter is not None:
+            self.yaml_emitter.add_comment("Newton step %d" % (k + 1))
+            self.yaml_emitter.begin_map()
+            self.yaml_emitter.add_key_value("Fx_norm", Fx_norm)
+        return
+
+    def linear_solve(self, out, eta):
+        if self.yaml_emitter is not None:
+            self.yaml_emitter.add_key_value("relresvec", out.resnorms)
+            # self.yaml_emitter.add_key_value('relresvec[-1]', out['relresvec'][-1])
+            self.yaml_emitter.add_key_value("num_iter", len(out.resnorms) - 1)
+            self.yaml_emitter.add_key_value("eta", eta)
+        return
+
+    def abort_step(self):
+        if self.yaml_emitter is not None:
+            self.yaml_emitter.end_map()
+        return
+
+    def end_step(self, info):
+        """Closes the step and returns True if a hook requested to stop.
+        """
+        if self.yaml_emitter is not None:
+            self.yaml_emitter.end_map()
+        now = time.time()
+        info["step_time"] = now - self.step_start
+        info["time"] = now - self.start
+        if self.callback is None:
+            return False
+        return bool(self.callback(info))
+
+    def finish(self, Fx_norm, nonlinear_tol, stop_reason):
+        if self.yaml_emitter is None:
+            return
+        self.yaml_emitter.begin_map()
+        self.yaml_emitter.add_key_value("Fx_norm", Fx_norm)
+        self.yaml_emitter.end_map()
+        self.yaml_emitter.end_seq()
+        if Fx_norm > nonlinear_tol:
+            self.yaml_emitter.add_comment(
+                "Newton solver did not converge "
+                "(residual = %g > %g = tol, %s)" % (Fx_norm, nonlinear_tol, stop_reason)
+            )
+        if self.owns_yaml_emitter:
+            self.yaml_emitter.close()
+        else:
+            self.yaml_emitter.flush()
+        return
+
+
 def newton(
     x0,
     model_evaluator,
@@ -70,131 +883,462 @@ def newton(
     forcing_term="constant",
     debug=False,
     yaml_emitter=None,
+    callback=None,
+    linear_callback=None,
+    globalization=None,
+    deflation=None,
+    divergence_detector=None,
+    scaled=False,
+    single_precision_eta=None,
+    quasi_newton=None,
+    max_linear_histories=None,
+    trace_memory=False,
 ):
     """Newton's method with different forcing terms.
+
+    `forcing_term` is "constant" (eta0 in all steps), "adaptive" (see
+    :class:`ForcingCostAware`) or an object like :class:`Forcing_EW1`. The
+    forcing terms used are returned under "forcing terms", the reasoning
+    behind them (if the forcing term records it) under "forcing choices".
+
+    `callback`, if given, is called after each Newton step with a dictionary
+    containing the step number, the residual norm, eta, the number of Krylov
+    iterations and timings. `linear_callback` is called after each application
+    of the Jacobian in the Krylov solver with the Newton step, the number of
+    applications and the time spent in the linear solve so far. If either
+    returns True, the iteration is stopped and the reason is reported under
+    "stop reason".
+
+    `globalization` determines how the Newton update is applied: None (always
+    take the full step), "line search" (:class:`LineSearch`), "dogleg"
+    (:class:`DoglegTrustRegion`) or an instance of any of these. The length of
+    the accepted steps relative to the Newton step is returned under "step
+    lengths".
+
+    `deflation` is a list of known solutions (or a :class:`Deflation`) which
+    Newton's method is steered away from.
+
+    If a `divergence_detector` (see :class:`DivergenceDetector`) is given, runs
+    that are unlikely to converge are stopped early. Krylov solves that hit the
+    maximum number of iterations then don't raise, but are counted and their
+    last iterate is used for the update.
+
+    If `scaled` is True, the iteration runs in the variables of
+    `model_evaluator.get_scaled()` (e.g., :math:`D^{1/2}x` with the control
+    volumes D, see :class:`pynosh.modelevaluator_nls.ScaledNlsModelEvaluator`)
+    in which the Krylov solvers work with the Euclidean inner product. x0 and
+    the deflated states are scaled once at the beginning and the solution is
+    scaled back once at the end; the residual norms are the same.
+    `vector_factory_generator` then receives the scaled state.
+
+    If `single_precision_eta` is given, the linear systems of all steps whose
+    forcing term eta is larger than it are solved in single precision
+    (complex64 copies of the kinetic energy operator, the Jacobian, the
+    preconditioner and the right-hand side, and a separate recycling solver).
+    The residuals and the Newton update are always kept in double precision.
+    The precision of each linear solve is reported as "linear_precision" to
+    the callback.
+
+    If `quasi_newton` is True (or a :class:`QuasiNewton`), the Jacobian and
+    the preconditioners are only rebuilt when the convergence degrades; in
+    between, the Jacobian is corrected with low-rank secant updates. The
+    number of updates each step was computed with is reported as
+    "quasi_newton_updates" to the callback.
+
+    The history (residual norms, forcing terms, step lengths, numbers of
+    Krylov iterations, peak memory) is returned in numpy arrays. Of the linear
+    residual histories, only the last `max_linear_histories` are kept if
+    given. The peak memory is only measured if `trace_memory` is True (NaN
+    otherwise): the maximum number of bytes allocated within each step on top
+    of what was in use at its beginning, traced with :mod:`tracemalloc`
+    (which slows down the allocations).
     """
+    if deflation is not None and not isinstance(deflation, Deflation):
+        deflation = Deflation(deflation)
+    if scaled:
+        model_evaluator, x0, deflation = _scale_problem(model_evaluator, x0, deflation)
 
     # Default forcing term.
     if forcing_term == "constant":
         forcing_term = ForcingConstant(eta0)
+    elif forcing_term == "adaptive":
+        forcing_term = ForcingCostAware(nonlinear_tol)
 
     if recycling_solver_kwargs is None:
         recycling_solver_kwargs = {}
 
+    globalization = _get_globalization(globalization)
+    quasi_newton = _get_quasi_newton(quasi_newton)
+
+    linearizer = _Linearizer(model_evaluator, compute_f_extra_args)
+    compute_f = linearizer.compute_f
+
+    def inner_product(phi0, phi1):
+        return numpy.real(model_evaluator.inner_product(phi0, phi1)).item()
+
     # Some initializations.
     # Set the default error code to 'failure'.
     error_code = 1
+    stop_reason = "maxiter"
     k = 0
 
     x = x0.copy()
-    Fx = model_evaluator.compute_f(x, **compute_f_extra_args)
-    Fx_norms = [numpy.sqrt(model_evaluator.inner_product(Fx, Fx))]
+    Fx = compute_f(x)
+    history = _NewtonHistory(
+        numpy.sqrt(inner_product(Fx, Fx)), newton_maxiter, max_linear_histories
+    )
+    Fx_norms = history.Fx_norms
     eta_previous = None
-    linear_relresvecs = []
+    num_krylov_failures = 0
+    if divergence_detector is not None:
+        divergence_detector.begin(x0)
 
     # get recycling solver
     recycling_solver = RecyclingSolver()
+    recycling_solvers = collections.defaultdict(RecyclingSolver)
+    recycling_solvers[None] = recycling_solver
 
     # no solution in before first iteration if Newton
-    out = None
+    linear_relres = None
 
-    if debug:
-        from . import yaml
+    monitor = _NewtonMonitor(debug, yaml_emitter, callback)
+    step_memory = _StepMemory(trace_memory)
 
-        if yaml_emitter is None:
-            yaml_emitter = yaml.YamlEmitter()
-            yaml_emitter.begin_doc()
-        yaml_emitter.begin_seq()
+    try:
+        while Fx_norms[-1] > nonlinear_tol and k < newton_maxiter:
+            monitor.begin_step(k, Fx_norms[-1])
+            step_memory.begin()
 
-    while Fx_norms[-1] > nonlinear_tol and k < newton_maxiter:
-        if debug:
-            yaml_emitter.add_comment("Newton step %d" % (k + 1))
-            yaml_emitter.begin_map()
-            yaml_emitter.add_key_value("Fx_norm", Fx_norms[-1][0][0])
+            # Get tolerance for next linear solve.
+            eta = _get_eta(forcing_term, k, eta0, eta_previous, linear_relres, Fx_norms)
+            eta_previous = eta
+            dtype = _get_linear_dtype(eta, single_precision_eta)
 
-        # Get tolerance for next linear solve.
-        if k == 0:
-            eta = eta0
-        else:
-            eta = forcing_term.get(
-                eta_previous, out.resnorms[-1], Fx_norms[-1], Fx_norms[-2]
+            # Get the vector factory. The last solver of the recycling solver
+            # references the previous linear system and with it the previous
+            # Jacobian and preconditioner; it is released here (after
+            # extracting the recycled vectors) so that two of them are never
+            # alive at the same time. The quasi-Newton object keeps the
+            # operators it reuses.
+            vector_factory = _get_vector_factory(
+                vector_factory_generator, x, recycling_solvers[dtype]
+            )
+
+            # Setup linear problem.
+            jacobian, M, Minv = _get_operators(
+                linearizer, quasi_newton, x, Fx, dtype, Fx_norms
             )
-        eta_previous = eta
+            if linear_callback is not None:
+                operator = _hooked_operator(jacobian, linear_callback, k + 1)
+            else:
+                operator = jacobian
+
+            # Create the linear system.
+            linear_system = krypy.linsys.TimedLinearSystem(
+                operator,
+                -Fx.astype(jacobian.dtype, copy=False),
+                M=Minv,
+                Minv=M,
+                ip_B=model_evaluator.inner_product,
+                normal=True,
+                self_adjoint=True,
+            )
+
+            linear_start = time.time()
+            try:
+                out, krylov_failure = _krylov_solve(
+                    recycling_solvers[dtype],
+                    linear_system,
+                    vector_factory,
+                    eta,
+                    recycling_solver_kwargs,
+                    divergence_detector is not None,
+                )
+            except _StopRequest:
+                stop_reason = "linear callback"
+                monitor.abort_step()
+                break
+            linear_time = time.time() - linear_start
+            num_krylov_failures += krylov_failure
+            monitor.linear_solve(out, eta)
+
+            # perform the Newton update
+            dx = out.xk.astype(x.dtype, copy=False)
+            if deflation is not None:
+                dx = deflation.get_step_factor(x, dx, inner_product) * dx
+            x, Fx, Fx_norm, step_info = globalization.step(
+                x, dx, Fx, Fx_norms[-1], eta, jacobian, compute_f, inner_product
+            )
+            if quasi_newton is not None:
+                step_info["quasi_newton_updates"] = quasi_newton.update(
+                    x, Fx, model_evaluator.inner_product
+                )
+
+            # Only the recycling solver (and the quasi-Newton object) hold on
+            # to the operators of this step now.
+            linear_relres = out.resnorms[-1]
+            resnorms = out.resnorms
+            del jacobian, operator, M, Minv, linear_system, dx, out
+
+            k += 1
+            info = {
+                "newton_step": k,
+                "Fx_norm": Fx_norm,
+                "eta": eta,
+                "num_linear_iter": len(resnorms) - 1,
+                "linear_time": linear_time,
+                "linear_relres": linear_relres,
+                "linear_precision": "double" if dtype is None else "single",
+                "peak_memory": step_memory.end(),
+            }
+            info.update(step_info)
+            history.add(info, resnorms)
+            Fx_norms = history.Fx_norms
+            stop_requested = monitor.end_step(info)
+            _observe(forcing_term, info)
+            if stop_requested:
+                stop_reason = "callback"
+                break
+            reason = _check_step(
+                step_info, divergence_detector, Fx_norms, x, num_krylov_failures
+            )
+            if reason is not None:
+                stop_reason = reason
+                break
+    finally:
+        step_memory.stop()
 
-        # Setup linear problem.
-        jacobian = model_evaluator.get_jacobian(x, **compute_f_extra_args)
+    if Fx_norms[-1] < nonlinear_tol:
+        error_code = 0
+        stop_reason = "converged"
 
-        M = model_evaluator.get_preconditioner(x, **compute_f_extra_args)
-        Minv = model_evaluator.get_preconditioner_inverse(x, **compute_f_extra_args)
+    monitor.finish(Fx_norms[-1], nonlinear_tol, stop_reason)
 
-        # get vector factory
-        if vector_factory_generator is not None:
-            vector_factory = vector_factory_generator(x)
+    newton_out = {
+        "x": model_evaluator.unscale(x) if scaled else x,
+        "info": error_code,
+        "stop reason": stop_reason,
+        "forcing choices": getattr(forcing_term, "choices", None),
+        "recycling_solver": recycling_solver,
+    }
+    newton_out.update(history.get())
+    return newton_out
+
+
+def anderson(
+    x0,
+    model_evaluator,
+    nonlinear_tol=1.0e-10,
+    switch_tol=1.0e-3,
+    maxiter=100,
+    m=5,
+    beta=1.0,
+    compute_f_extra_args={},
+    newton_kwargs=None,
+):
+    """Anderson-accelerated fixed-point iteration
+
+    .. math::
+        x_{k+1} = x_k - M^{-1} F(x_k)
+
+    where the preconditioner :math:`M^{-1}` is set up only once at `x0` (so
+    the model evaluator's preconditioner type mustn't be "none"). This
+    is considerably cheaper per step than Newton's method, so it is used to
+    get close to a solution. As soon as the residual norm drops below
+    `switch_tol`, the iteration continues with :func:`newton` (with the
+    arguments `newton_kwargs`).
+
+    See
+    "Anderson Acceleration for Fixed-Point Iterations (2011)"
+    -- Walker, Ni
+    """
+    if newton_kwargs is None:
+        newton_kwargs = {}
+
+    def compute_f(x):
+        return model_evaluator.compute_f(x, **compute_f_extra_args)
+
+    def inner_product(phi0, phi1):
+        return numpy.real(model_evaluator.inner_product(phi0, phi1)).item()
+
+    x = x0.copy()
+    Fx = compute_f(x)
+    Fx_norms = [numpy.sqrt(inner_product(Fx, Fx))]
+
+    Minv = model_evaluator.get_preconditioner_inverse(x, **compute_f_extra_args)
+    if Minv is None:
+        # Without it, the fixed-point iteration diverges for any reasonable
+        # discretization (the spectrum of the Jacobian grows with the mesh
+        # resolution).
+        raise ValueError("Anderson acceleration needs a preconditioner.")
+    gx = -(Minv * Fx)
+
+    # differences of the last m iterates and fixed-point residuals
+    dX = []
+    dG = []
+    k = 0
+    while Fx_norms[-1] > max(switch_tol, nonlinear_tol) and k < maxiter:
+        # Find the real coefficients gamma that minimize
+        # ||gx - sum_i gamma_i dG[i]||.
+        dx = beta * gx
+        if dG:
+            gram = numpy.array([[inner_product(a, b) for b in dG] for a in dG])
+            rhs = numpy.array([inner_product(a, gx) for a in dG])
+            gamma = numpy.linalg.lstsq(gram, rhs, rcond=None)[0]
+            for gamma_i, dx_i, dg_i in zip(gamma, dX, dG):
+                dx -= gamma_i * (dx_i + beta * dg_i)
+
+        x += dx
+        Fx = compute_f(x)
+        Fx_norms.append(numpy.sqrt(inner_product(Fx, Fx)))
+        gx_new = -(Minv * Fx)
+
+        if Fx_norms[-1] > Fx_norms[-2]:
+            # Restart if the acceleration doesn't help. If not even the plain
+            # fixed-point step reduces the residual, go back and leave it to
+            # Newton.
+            if not dX:
+                x -= dx
+                Fx_norms.pop()
+                break
+            dX = []
+            dG = []
         else:
-            vector_factory = None
-
-        # Create the linear system.
-        linear_system = krypy.linsys.TimedLinearSystem(
-            jacobian,
-            -Fx,
-            M=Minv,
-            Minv=M,
-            ip_B=model_evaluator.inner_product,
-            normal=True,
-            self_adjoint=True,
-        )
+            dX.append(dx)
+            dG.append(gx_new - gx)
+            if len(dX) > m:
+                dX.pop(0)
+                dG.pop(0)
+        gx = gx_new
+        k += 1
 
-        out = recycling_solver.solve(
-            linear_system, vector_factory, tol=eta, **recycling_solver_kwargs
+    if Fx_norms[-1] > nonlinear_tol:
+        out = newton(
+            x,
+            model_evaluator,
+            nonlinear_tol=nonlinear_tol,
+            compute_f_extra_args=compute_f_extra_args,
+            **newton_kwargs
         )
+    else:
+        # Same output as a Newton run that converged without taking a step.
+        out = {
+            "x": x,
+            "info": 0,
+            "stop reason": "converged",
+            "forcing choices": None,
+            "recycling_solver": None,
+        }
+        out.update(_NewtonHistory(Fx_norms[-1], 0, None).get())
+    out["fixed-point residuals"] = numpy.array(Fx_norms)
+    return out
 
-        if debug:
-            yaml_emitter.add_key_value("relresvec", out.resnorms)
-            # yaml_emitter.add_key_value('relresvec[-1]', out['relresvec'][-1])
-            yaml_emitter.add_key_value("num_iter", len(out.resnorms) - 1)
-            yaml_emitter.add_key_value("eta", eta)
 
-        # save the convergence history
-        linear_relresvecs.append(out.resnorms)
+def _interpolate(coords_from, coords_to, x):
+    """Piecewise linear interpolation of the nodal values x from one set of
+    points to another. Points outside of the convex hull of `coords_from`
+    get the value of the nearest node.
+    """
+    from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
 
-        # perform the Newton update
-        x += out.xk
+    # Drop coordinates which are constant for all nodes, e.g., z=0 for
+    # two-dimensional meshes; Delaunay can't deal with those.
+    active = numpy.ptp(coords_from, axis=0) > 1.0e-13 * numpy.ptp(coords_from)
+    coords_from = coords_from[:, active]
+    coords_to = coords_to[:, active]
 
-        # do the household
-        k += 1
-        Fx = model_evaluator.compute_f(x, **compute_f_extra_args)
-        Fx_norms.append(numpy.sqrt(model_evaluator.inner_product(Fx, Fx)[0, 0]))
+    values = x.reshape(len(coords_from))
+    y = LinearNDInterpolator(coords_from, values)(coords_to)
+    outside = numpy.isnan(y)
+    if outside.any():
+        y[outside] = NearestNDInterpolator(coords_from, values)(coords_to[outside])
+    return y.reshape((len(coords_to),) + x.shape[1:])
 
-        # run garbage collector in order to prevent MemoryErrors from being
-        # raised
-        import gc
 
-        gc.collect()
+def _get_cache_key(value):
+    """Hashable stand-in for `value`; arrays (and sequences) are represented
+    by the SHA-1 of their data, their shape and their dtype.
+    """
+    if isinstance(value, (numpy.ndarray, list, tuple)):
+        value = numpy.ascontiguousarray(value)
+        return (
+            hashlib.sha1(value.view(numpy.uint8)).hexdigest(),
+            value.shape,
+            value.dtype.str,
+        )
+    return value
 
-        if debug:
-            yaml_emitter.end_map()
 
-    if Fx_norms[-1] < nonlinear_tol:
-        error_code = 0
+class NestedIteration(object):
+    """Mesh sequencing: Solve the problem on a sequence of successively finer
+    meshes, each time starting Newton's method from the interpolated solution
+    of the previous level. Solutions on all but the finest level are cached
+    such that subsequent solves with the same initial guess and parameters
+    start right on the finest level.
+    """
 
-    if debug:
-        yaml_emitter.begin_map()
-        yaml_emitter.add_key_value("Fx_norm", Fx_norms[-1])
-        yaml_emitter.end_map()
-        yaml_emitter.end_seq()
-        if Fx_norms[-1] > nonlinear_tol:
-            yaml_emitter.add_comment(
-                "Newton solver did not converge "
-                "(residual = %g > %g = tol)" % (Fx_norms[-1], nonlinear_tol)
+    def __init__(self, model_evaluators, **newton_kwargs):
+        """`model_evaluators` are ordered from the coarsest to the finest mesh;
+        `newton_kwargs` are passed on to :func:`newton`.
+        """
+        self.model_evaluators = model_evaluators
+        self.newton_kwargs = newton_kwargs
+        self._cache = {}
+        return
+
+    def solve(self, x0, compute_f_extra_args={}):
+        """Solve starting from x0, given on the coarsest mesh. The result is
+        always the one on the finest mesh: If Newton's method fails on a coarse
+        level, the next level starts from the interpolated initial guess of
+        the failed one instead.
+        """
+        key = (
+            _get_cache_key(x0),
+            tuple(
+                (name, _get_cache_key(value))
+                for name, value in sorted(compute_f_extra_args.items())
+            ),
+        )
+        levels = []
+
+        # Start on the finest level that has a cached solution.
+        start = 0
+        x = x0
+        for k in range(len(self.model_evaluators) - 1):
+            if (k, key) in self._cache:
+                start = k + 1
+                x = self._cache[(k, key)]
+
+        for k in range(start, len(self.model_evaluators)):
+            modeleval = self.model_evaluators[k]
+            if k > 0:
+                x = _interpolate(
+                    self.model_evaluators[k - 1].mesh.node_coords,
+                    modeleval.mesh.node_coords,
+                    x,
+                )
+            out = newton(
+                x,
+                modeleval,
+                compute_f_extra_args=compute_f_extra_args,
+                **self.newton_kwargs
             )
+            levels.append(
+                {
+                    "num_nodes": len(modeleval.mesh.node_coords),
+                    "info": out["info"],
+                    "Newton residuals": out["Newton residuals"],
+                }
+            )
+            if out["info"] != 0:
+                # Don't go on with a garbage initial guess.
+                continue
+            x = out["x"]
+            if k < len(self.model_evaluators) - 1:
+                self._cache[(k, key)] = x
 
-    return {
-        "x": x,
-        "info": error_code,
-        "Newton residuals": Fx_norms,
-        "linear relresvecs": linear_relresvecs,
-        "recycling_solver": recycling_solver,
-    }
+        out["levels"] = levels
+        return out
 
 
 def poor_mans_continuation(
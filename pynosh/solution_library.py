@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+"""
+Collection of distinct solution states.
+"""
+import numpy
+
+
+class SolutionLibrary(object):
+    """Stores solutions and finds duplicates modulo the phase, i.e., two states
+    :math:`\\psi_0`, :math:`\\psi_1` are considered equal if
+
+    .. math::
+        \\min_\\theta \\|\\psi_0 - e^{i\\theta}\\psi_1\\|^2 < tol.
+
+    Each state gets a cheap gauge-invariant fingerprint (energy, moments of
+    :math:`|\\psi|^2`, vortex counts); the norm is only computed for states
+    whose energy and moments are close enough to those of psi. "Close
+    enough" is derived from tol, so no state that's equal to psi in the
+    above sense is skipped.
+    """
+
+    def __init__(self, modeleval, tol=1.0e-10):
+        """Initialization.
+        """
+        self.modeleval = modeleval
+        self.tol = tol
+        self.states = []
+        self._fingerprints = []
+        self._fingerprint_array = None
+        # norms and maximum absolute values of the states
+        self._norms = []
+        self._sups = []
+        return
+
+    def __len__(self):
+        return len(self.states)
+
+    def fingerprint(self, psi):
+        """Returns the real-valued vector
+
+            [energy, <|psi|^2>, <|psi|^2 x>, <|psi|^2 y>, <|psi|^2 z>,
+             num_vortices, net_vorticity]
+
+        where <.> denotes the average over the domain.
+        """
+        mesh = self.modeleval.mesh
+        if mesh.control_volumes is None:
+            mesh.compute_control_volumes(variant=self.modeleval.cv_variant)
+        cv = mesh.control_volumes
+        psi = psi.reshape(len(cv))
+        abs2 = psi.real ** 2 + psi.imag ** 2
+        volume = cv.sum()
+
+        mass = numpy.dot(cv, abs2)
+        moments = numpy.dot(cv * abs2, mesh.node_coords) / volume
+
+        # Winding number of the phase along the boundary of each triangle
+        # (cell or, in 3D, face), i.e., the sum of the phase jumps along its
+        # edges. Skip triangles where psi (nearly) vanishes; the phase is
+        # meaningless there.
+        edges = mesh.idx_hierarchy.reshape(2, 3, -1)
+        winding = numpy.sum(numpy.angle(psi[edges[1]] * psi[edges[0]].conj()), axis=0)
+        winding = numpy.rint(winding / (2 * numpy.pi))
+        vanishing = numpy.any(abs2[edges[0]] < 1.0e-8 * abs2.max(), axis=0)
+        winding[vanishing] = 0.0
+
+        return numpy.concatenate(
+            [
+                [numpy.asarray(self.modeleval.energy(psi)).item(), mass / volume],
+                moments,
+                [numpy.count_nonzero(winding), winding.sum()],
+            ]
+        )
+
+    def find(self, psi, fingerprint=None):
+        """Returns the index of the stored state equal to psi, or None.
+        """
+        if not self.states:
+            return None
+        if fingerprint is None:
+            fingerprint = self.fingerprint(psi)
+        if self._fingerprint_array is None:
+            self._fingerprint_array = numpy.array(self._fingerprints)
+
+        psi = psi.reshape(-1, 1)
+        psi_norm2 = self._ip(psi, psi)
+        slack = self._get_slack(numpy.sqrt(psi_norm2), numpy.max(abs(psi)))
+
+        # Prefilter with energy and moments. (The vortex counts can change
+        # under arbitrarily small perturbations and aren't used here.)
+        F = self._fingerprint_array[:, :-2]
+        fingerprint = fingerprint[:-2]
+        rounding = 1.0e-12 * numpy.maximum(abs(F), abs(fingerprint)) + 1.0e-15
+        is_close = numpy.all(abs(F - fingerprint) <= slack + rounding, axis=1)
+
+        for k in numpy.nonzero(is_close)[0]:
+            state = self.states[k]
+            # min_theta ||psi - exp(i theta) state||^2
+            #   = ||psi||^2 + ||state||^2 - 2 |<state, psi>|
+            a = self._ip(state, psi)
+            b = self._ip(1j * state, psi)
+            dist2 = psi_norm2 + self._ip(state, state) - 2 * numpy.sqrt(a ** 2 + b ** 2)
+            if dist2 < self.tol:
+                return k
+        return None
+
+    def add(self, psi, fingerprint=None):
+        """Stores psi (regardless of whether it's already in the library) and
+        returns its index.
+        """
+        if fingerprint is None:
+            fingerprint = self.fingerprint(psi)
+        psi = psi.reshape(-1, 1)
+        self.states.append(psi)
+        self._fingerprints.append(fingerprint)
+        self._fingerprint_array = None
+        self._norms.append(numpy.sqrt(self._ip(psi, psi)))
+        self._sups.append(numpy.max(abs(psi)))
+        return len(self.states) - 1
+
+    def _get_slack(self, psi_norm, psi_sup):
+        """Returns, for each stored state s, bounds for how much energy and
+        moments of s and psi can differ if
+
+            ||delta|| < sqrt(tol),  delta = psi - exp(i theta) s
+
+        for some theta. With a = |psi|, b = |s| (pointwise), |a^2 - b^2| <=
+        |delta| (a + b), so by Cauchy-Schwarz
+
+            |<a^2> - <b^2>| <= ||delta|| (||psi|| + ||s||) / volume,
+            |<a^2 x> - <b^2 x>| <= ||delta|| max|x| (||psi|| + ||s||) / volume,
+            |<a^4> - <b^4>|
+              <= ||delta|| (max(a)^2 + max(b)^2) (||psi|| + ||s||) / volume,
+
+        the last one for the energy -<|psi|^4> of the model evaluator.
+        """
+        mesh = self.modeleval.mesh
+        volume = mesh.control_volumes.sum()
+        eps = numpy.sqrt(self.tol)
+        norm_sum = psi_norm + numpy.array(self._norms)
+        sup2_sum = psi_sup ** 2 + numpy.array(self._sups) ** 2
+        max_x = numpy.max(abs(mesh.node_coords), axis=0)
+        return (
+            eps
+            / volume
+            * numpy.column_stack(
+                [sup2_sum * norm_sum, norm_sum] + [m * norm_sum for m in max_x]
+            )
+        )
+
+    def _ip(self, phi0, phi1):
+        return numpy.real(self.modeleval.inner_product(phi0, phi1)).item()
@@ -3,30 +3,178 @@
 """
 Simple YAML emitter.
 """
+import atexit
+import io
+import queue
+import sys
+import threading
+import weakref
 
-# Python 2, 3 compatibility for print().
+import numpy
+
+
+class _Writer(object):
+    """The background thread that writes the output of all emitters.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return
+
+    def _run(self):
+        while True:
+            output, text = self.queue.get()
+            try:
+                output.stream.write(text)
+            except Exception as e:
+                output.errors.append(e)
+            finally:
+                output.done()
+                self.queue.task_done()
+
+
+class _Output(object):
+    """The stream of an emitter along with the number of texts handed over to
+    the writer thread that haven't been written yet and the errors that
+    occurred while writing.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.errors = []
+        self._num_pending = 0
+        self._condition = threading.Condition()
+        return
+
+    def add(self):
+        with self._condition:
+            self._num_pending += 1
+        return
+
+    def done(self):
+        with self._condition:
+            self._num_pending -= 1
+            if self._num_pending == 0:
+                self._condition.notify_all()
+        return
+
+    def wait(self):
+        """Waits until everything handed over has been written.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._num_pending == 0)
+        return
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+# emitters that haven't been closed; flushed at exit
+_emitters = weakref.WeakSet()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _Writer()
+    return _writer
+
+
+def _hand_over(output, buffer):
+    """Hands the buffered text over to the writer thread.
+    """
+    if buffer:
+        text = "".join(buffer)
+        del buffer[:]
+        output.add()
+        _get_writer().queue.put((output, text))
+    return
+
+
+@atexit.register
+def _flush_at_exit():
+    for emitter in list(_emitters):
+        # The stream might be gone already.
+        try:
+            emitter.flush()
+        except (OSError, ValueError):
+            pass
+    # what collected emitters have handed over
+    if _writer is not None:
+        _writer.queue.join()
+    return
 
 
 class YamlEmitter(object):
     """
     Simple YAML emitter.
+
+    The output goes to `stream` (default: sys.stdout). It is collected in a
+    buffer, and whenever that holds more than `buffer_size` characters, it
+    is handed over to a background thread (shared by all emitters) that does
+    the actual writing, so the caller never waits for the stream. The output
+    is flushed when the top-level sequence or map ends, or by :meth:`flush`.
+    Emitters that aren't closed are flushed when they are garbage collected
+    or at exit.
     """
 
-    def __init__(self):
+    def __init__(self, stream=None, buffer_size=2 ** 16):
         """Initialization.
         """
         self.envs = []
         self.indent = 0
         self.next_indent = self.indent
         self.key_is_next = True
+
+        self.stream = sys.stdout if stream is None else stream
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffer_len = 0
+        self._output = _Output(self.stream)
+        # Hand over what's left when the emitter is collected.
+        weakref.finalize(self, _hand_over, self._output, self._buffer)
+        _emitters.add(self)
+        return
+
+    def _write(self, text):
+        self._buffer.append(text)
+        self._buffer_len += len(text)
+        if self._buffer_len > self.buffer_size:
+            _hand_over(self._output, self._buffer)
+            self._buffer_len = 0
+        return
+
+    def flush(self):
+        """Writes out all buffered output and waits until it's written (but not
+        for the output of other emitters).
+        """
+        _hand_over(self._output, self._buffer)
+        self._buffer_len = 0
+        self._output.wait()
+        self.stream.flush()
+        errors = self._output.errors
+        if errors:
+            error = errors[0]
+            del errors[:]
+            raise error
+        return
+
+    def close(self):
+        """Flushes the output. The stream itself is not closed.
+        """
+        self.flush()
+        _emitters.discard(self)
         return
 
     def begin_doc(self):
-        print("---")
+        self._write("---\n")
         return
 
     def add_comment(self, comment):
-        print(self.indent * " " + "# " + comment)
+        self._write(self.indent * " " + "# " + comment + "\n")
         return
 
     def begin_seq(self):
@@ -35,7 +183,7 @@ class YamlEmitter(object):
         elif self.envs[-1] == "seq":
             self.indent += 2
             self.next_indent = 0
-            print("-", end=" ")
+            self._write("- ")
         elif self.envs[-1] == "map":
             self.indent += 4
             self.next_indent = self.indent
@@ -49,7 +197,7 @@ class YamlEmitter(object):
     def add_item(self, item):
         assert self.envs
         assert self.envs[-1] == "seq"
-        print(self.next_indent * " " + "-" + item)
+        self._write(self.next_indent * " " + "-" + item + "\n")
         self.next_indent = self.indent
         return
 
@@ -58,7 +206,7 @@ class YamlEmitter(object):
         assert self.envs[-1] == "seq"
         self.envs.pop()
         if not self.envs:
-            pass
+            self.flush()
         elif self.envs[-1] == "seq":
             self.indent -= 2
         elif self.envs[-1] == "map":
@@ -72,13 +220,13 @@ class YamlEmitter(object):
         if not self.envs:
             pass
         elif self.envs[-1] == "seq":
-            print(self.indent * " " + "-", end=" ")
+            self._write(self.indent * " " + "- ")
             self.indent += 2
             self.next_indent = 0
         elif self.envs[-1] == "map":
             self.indent += 4
             self.next_indent = self.indent
-            print()
+            self._write("\n")
         else:
             raise ValueError("Unknown environment.")
         self.envs.append("map")
@@ -89,7 +237,7 @@ class YamlEmitter(object):
         assert self.envs
         assert self.envs[-1] == "map"
         assert self.key_is_next
-        print(self.next_indent * " " + "%r:" % key)
+        self._write(self.next_indent * " " + "%r:\n" % key)
         self.key_is_next = False
         return
 
@@ -97,7 +245,7 @@ class YamlEmitter(object):
         assert self.envs
         assert self.envs[-1] == "map"
         assert not self.key_is_next
-        print("%r" % item)
+        self._write(_format(item) + "\n")
         self.key_is_next = True
         self.next_indent = self.indent
         return
@@ -106,7 +254,7 @@ class YamlEmitter(object):
         assert self.envs
         assert self.envs[-1] == "map"
         assert self.key_is_next
-        print(self.next_indent * " " + "%r: %r" % (key, value))
+        self._write(self.next_indent * " " + "%r: %s\n" % (key, _format(value)))
         self.next_indent = self.indent
         return
 
@@ -115,7 +263,7 @@ class YamlEmitter(object):
         assert self.envs[-1] == "map"
         self.envs.pop()
         if not self.envs:
-            pass
+            self.flush()
         elif self.envs[-1] == "seq":
             self.indent -= 2
         elif self.envs[-1] == "map":
@@ -124,3 +272,35 @@ class YamlEmitter(object):
             raise ValueError("Unknown environment.")
         self.next_indent = self.indent
         return
+
+
+def _format(value):
+    """Formats numpy arrays and sequences as YAML flow sequences, other
+    values through repr. Unlike repr(), this doesn't abbreviate large
+    arrays.
+    """
+    if isinstance(value, numpy.ndarray):
+        return _format_array(value)
+    if isinstance(value, numpy.generic):
+        value = value.item()
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_format(item) for item in value) + "]"
+    return repr(value)
+
+
+def _format_array(value):
+    """Formats a numpy array as a (nested) YAML flow sequence. The rows of the
+    innermost two dimensions are formatted all at once by numpy.savetxt.
+    """
+    if value.ndim == 0:
+        return _format(value.item())
+    if value.ndim == 1:
+        return _format_array(value[None])[1:-1]
+    if value.ndim > 2 or numpy.iscomplexobj(value):
+        return "[" + ", ".join(_format(item) for item in value) + "]"
+    if len(value) == 0:
+        return "[]"
+    buf = io.StringIO()
+    numpy.savetxt(buf, value, fmt="%r", delimiter=", ", newline="], [")
+    # drop the separator after the last row
+    return "[[" + buf.getvalue()[: -len(", [")] + "]"
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+import os
+
+import meshplex
+import numpy
+
+from pynosh import modelevaluator_nls
+from pynosh import modelevaluator_bordering_constant
+from pynosh import numerical_methods as nm
+
+
+def _get_problem(filename="rectanglesmall.e", preconditioner_type="none"):
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, filename)
+    mesh, point_data, field_data, _ = meshplex.read(filename)
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh,
+        V=point_data["V"],
+        A=point_data["A"],
+        preconditioner_type=preconditioner_type,
+    )
+    psi0 = point_data["psi"][:, 0] + 1j * point_data["psi"][:, 1]
+    psi0 = psi0.reshape(-1, 1)
+    # Border with i*psi0 to fix the gauge.
+    bordered = modelevaluator_bordering_constant.ConstBorderedModelEvaluator(
+        modeleval, 1j * psi0
+    )
+    x0 = numpy.concatenate([psi0, [[0.0]]])
+    return bordered, x0
+
+
+def test_jacobian_inverse():
+    bordered, x0 = _get_problem()
+    args = {"mu": 1.0e-2, "g": 1.0}
+    n = len(x0)
+
+    numpy.random.seed(0)
+    x = numpy.random.rand(n, 2) + 1j * numpy.random.rand(n, 2)
+    x[-1] = x[-1].real
+
+    J = bordered.get_jacobian(x0, **args)
+    Jinv = bordered.get_jacobian_inverse(x0, **args)
+    z = Jinv * (J * x)
+    assert z.shape == x.shape
+    diff = z - x
+    assert numpy.all(
+        numpy.sqrt(numpy.diag(bordered.inner_product(diff, diff))) < 1.0e-8
+    )
+    return
+
+
+def test_newton():
+    bordered, x0 = _get_problem()
+
+    out = nm.newton(x0, bordered, compute_f_extra_args={"mu": 1.0e-2, "g": 1.0})
+    assert out["info"] == 0
+    return
+
+
+def test_preconditioner():
+    bordered, x0 = _get_problem(preconditioner_type="exact")
+    args = {"mu": 1.0e-2, "g": 1.0}
+
+    M = bordered.get_preconditioner(x0, **args)
+    Minv = bordered.get_preconditioner_inverse(x0, **args)
+    numpy.random.seed(0)
+    x = numpy.random.rand(len(x0), 1) + 1j * numpy.random.rand(len(x0), 1)
+    x[-1] = x[-1].real
+    diff = Minv * (M * x) - x
+    assert numpy.sqrt(bordered.inner_product(diff, diff)[0, 0]) < 1.0e-8
+
+    # Bordered solves take about as many iterations as unbordered ones.
+    out = nm.newton(x0, bordered, compute_f_extra_args=args)
+    assert out["info"] == 0
+    out_inner = nm.newton(x0[:-1], bordered.inner_modeleval, compute_f_extra_args=args)
+    for r, r_inner in zip(out["linear relresvecs"], out_inner["linear relresvecs"]):
+        assert len(r) <= len(r_inner) + 3
+    return
+
+
+def _get_multi_problem(preconditioner_type="none"):
+    bordered, x0 = _get_problem(preconditioner_type=preconditioner_type)
+    n = len(x0) - 1
+    numpy.random.seed(1)
+    bords = numpy.column_stack([bordered.bord[:, 0], numpy.random.rand(n)])
+    multi = modelevaluator_bordering_constant.ConstMultiBorderedModelEvaluator(
+        bordered.inner_modeleval, bords
+    )
+    return multi, numpy.concatenate([x0[0:n], [[0.0], [0.0]]])
+
+
+def test_multi_inverses():
+    multi, x0 = _get_multi_problem(preconditioner_type="exact")
+    args = {"mu": 1.0e-2, "g": 1.0}
+
+    numpy.random.seed(0)
+    x = numpy.random.rand(len(x0), 3) + 1j * numpy.random.rand(len(x0), 3)
+    x[-2:] = x[-2:].real
+
+    J = multi.get_jacobian(x0, **args)
+    Jinv = multi.get_jacobian_inverse(x0, **args)
+    M = multi.get_preconditioner(x0, **args)
+    Minv = multi.get_preconditioner_inverse(x0, **args)
+    for A, Ainv in [(J, Jinv), (M, Minv)]:
+        diff = Ainv * (A * x) - x
+        assert numpy.all(
+            numpy.sqrt(numpy.diag(multi.inner_product(diff, diff))) < 1.0e-8
+        )
+    return
+
+
+def test_multi_newton():
+    # With one border, the multi-bordered evaluator is the bordered one.
+    bordered, x0 = _get_problem(preconditioner_type="exact")
+    multi = modelevaluator_bordering_constant.ConstMultiBorderedModelEvaluator(
+        bordered.inner_modeleval, bordered.bord
+    )
+    args = {"mu": 1.0e-2, "g": 1.0}
+    out0 = nm.newton(x0, bordered, compute_f_extra_args=args)
+    out1 = nm.newton(x0, multi, compute_f_extra_args=args)
+    assert out1["info"] == 0
+    assert numpy.all(abs(out0["x"] - out1["x"]) < 1.0e-10)
+    return
@@ -72,3 +72,34 @@ def test(filename, control_values):
     )
     assert abs(control_values[2] - alpha) < tol
     return
+
+
+@pytest.mark.parametrize("filename", ["rectanglesmall.e", "pacman.e", "cubesmall.e"])
+def test_block(filename):
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, filename)
+    mesh, point_data, field_data, _ = meshplex.read(filename)
+    mu = 1.0e-2
+
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh, V=point_data["V"], A=point_data["A"]
+    )
+
+    psi = point_data["psi"][:, 0] + 1j * point_data["psi"][:, 1]
+    X = numpy.column_stack([psi, 0.5 * psi, numpy.exp(1j * mesh.node_coords[:, 0])])
+
+    # Evaluate all columns at once and compare with the single evaluations.
+    R = modeleval.compute_f(X, mu, 1.0)
+    energies = modeleval.energy(X)
+    ip = modeleval.inner_product(X, X)
+    assert R.shape == X.shape
+    assert energies.shape == (X.shape[1],)
+    assert ip.shape == (X.shape[1], X.shape[1])
+
+    tol = 1.0e-13
+    for k in range(X.shape[1]):
+        r = modeleval.compute_f(X[:, k], mu, 1.0)
+        assert numpy.all(abs(R[:, k] - r) < tol)
+        assert abs(energies[k] - modeleval.energy(X[:, k])) < tol
+        assert abs(ip[k, k] - modeleval.inner_product(X[:, k], X[:, k])) < tol
+    return
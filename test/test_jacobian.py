@@ -78,3 +78,33 @@ def test(filename, control_values):
     val = numpy.vdot(phi, mesh.control_volumes[:, None] * (J * phi)).real
     assert abs(control_values[2] - val) < tol
     return
+
+
+@pytest.mark.parametrize("filename", ["rectanglesmall.e", "cubesmall.e"])
+def test_linearize(filename):
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, filename)
+    mu = 1.0e-2
+
+    mesh, point_data, field_data, _ = meshplex.read(filename)
+
+    psi = point_data["psi"][:, 0] + 1j * point_data["psi"][:, 1]
+    num_unknowns = len(psi)
+    psi = psi.reshape(num_unknowns, 1)
+
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh, V=point_data["V"], A=point_data["A"], preconditioner_type="exact"
+    )
+    lin = modeleval.linearize(psi, mu, 1.0)
+
+    tol = 1.0e-12
+    F = modeleval.compute_f(psi, mu, 1.0)
+    assert numpy.all(abs(lin.F - F) < tol)
+
+    numpy.random.seed(0)
+    phi = numpy.random.rand(num_unknowns, 1) + 1j * numpy.random.rand(num_unknowns, 1)
+    for method in ["get_jacobian", "get_preconditioner"]:
+        A0 = getattr(lin, method)()
+        A1 = getattr(modeleval, method)(psi, mu, 1.0)
+        assert numpy.all(abs(A0 * phi - A1 * phi) < tol)
+    return
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 #
+import functools
 import os
 
 import meshplex
 import numpy
 import pytest
 
+from pynosh import magnetic_vector_potentials as mvp
 from pynosh import modelevaluator_nls
 
 
@@ -55,3 +57,60 @@ def test(filename, control_values):
     K = abs(keo.real) + abs(keo.imag)
     assert abs(control_values[1] - numpy.max(K.sum(0))) < tol
     return
+
+
+def test_edge_integrals():
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, "pacman.e")
+    mu = 1.0e-2
+    mesh, _, _, _ = meshplex.read(filename)
+
+    # The trapezoidal rule is exact for the linear potential of a constant
+    # field.
+    B = numpy.array([0.0, 0.0, 1.0])
+    modeleval0 = modelevaluator_nls.NlsModelEvaluator(
+        mesh, A=mvp.constant_field(mesh.node_coords, B)
+    )
+    modeleval1 = modelevaluator_nls.NlsModelEvaluator(
+        mesh, A=functools.partial(mvp.constant_field_edge_integral, B=B)
+    )
+    keo0 = modeleval0._get_keo(mu)
+    keo1 = modeleval1._get_keo(mu)
+    assert abs(keo0 - keo1).max() < 1.0e-13
+
+    x0 = numpy.array([0.0, 0.0, 5.0])
+    m = numpy.array([0.0, 0.0, 1.0])
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh, A=functools.partial(mvp.magnetic_dipole_edge_integral, x0=x0, m=m)
+    )
+    keo = modeleval._get_keo(mu)
+    assert abs(keo - keo.H).max() < 1.0e-13
+    return
+
+
+def test_field_direction():
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, "cubesmall.e")
+    mu = 1.0e-1
+    mesh, _, _, _ = meshplex.read(filename)
+
+    basis = [mvp.constant_field(mesh.node_coords, e) for e in numpy.eye(3)]
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh, A=basis, field_direction=[0.0, 0.0, 1.0]
+    )
+    for theta, phi in [(0.0, 0.0), (0.3, 1.2), (1.0, -0.5)]:
+        B = numpy.array(
+            [
+                numpy.cos(theta) * numpy.cos(phi),
+                numpy.cos(theta) * numpy.sin(phi),
+                numpy.sin(theta),
+            ]
+        )
+        modeleval.set_field_direction(B)
+        keo = modeleval._get_keo(mu)
+
+        reference = modelevaluator_nls.NlsModelEvaluator(
+            mesh, A=mvp.constant_field(mesh.node_coords, B)
+        )
+        assert abs(keo - reference._get_keo(mu)).max() < 1.0e-13
+    return
@@ -1,3 +1,4 @@
+import functools
 import os
 import numpy
 
@@ -93,5 +94,167 @@ def test_brick():
     return
 
 
+def test_dot_methods():
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, "rectanglesmall.e")
+    mesh, _, _, _ = meshplex.read(filename)
+
+    A_loop = mvp.magnetic_dot(mesh.node_coords, 2.0, [10.0, 11.0], method="loop")
+    A = mvp.magnetic_dot(mesh.node_coords, 2.0, [10.0, 11.0])
+    assert numpy.all(numpy.abs(A - A_loop) < 1.0e-13)
+
+    # The quadrature is only accurate up to about 1e-4.
+    A = mvp.magnetic_dot(mesh.node_coords, 2.0, [10.0, 11.0], method="elliptic")
+    assert numpy.all(numpy.abs(A - A_loop) < 1.0e-4 * numpy.max(numpy.abs(A_loop)))
+    return
+
+
+def test_evaluate():
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, "cubesmall.e")
+    mesh, _, _, _ = meshplex.read(filename)
+    X = mesh.node_coords
+
+    x0 = numpy.array([0, 0, 10])
+    m = numpy.array([0, 0, 1])
+    A_ref = mvp.magnetic_dipole(X, x0, m)
+    for executor in ["thread", "process"]:
+        A = mvp.evaluate(
+            mvp.magnetic_dipole,
+            X,
+            args=(x0, m),
+            chunk_size=7,
+            num_workers=2,
+            executor=executor,
+        )
+        assert numpy.all(numpy.abs(A - A_ref) < 1.0e-15)
+
+    out = numpy.empty((len(X), 3))
+    A = mvp.evaluate(
+        mvp.constant_field, X, args=(numpy.array([0, 0, 1]),), chunk_size=5, out=out
+    )
+    assert A is out
+    assert numpy.all(numpy.abs(A - mvp.constant_field(X, [0, 0, 1])) < 1.0e-15)
+
+    A_ref = mvp.magnetic_dot(X, 2.0, [10.0, 11.0])
+    A = mvp.magnetic_dot(X, 2.0, [10.0, 11.0], num_workers=2)
+    assert numpy.all(numpy.abs(A - A_ref) < 1.0e-15)
+    return
+
+
+def test_multiple_sources():
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, "pacman.e")
+    mesh, _, _, _ = meshplex.read(filename)
+    X = mesh.node_coords
+
+    numpy.random.seed(0)
+    x0 = numpy.column_stack(
+        [20 * numpy.random.rand(50, 2) - 10, 1.0 + numpy.random.rand(50)]
+    )
+    m = numpy.random.rand(50, 3) - 0.5
+    A_ref = sum(mvp.magnetic_dipole(X, x0[j], m[j]) for j in range(len(x0)))
+    A = mvp.dipoles(X, x0, m, leaf_size=4, box_size=32)
+    assert numpy.max(numpy.abs(A - A_ref)) < 1.0e-4 * numpy.max(numpy.abs(A_ref))
+    A = mvp.dipoles(X, x0, m, theta=0.05, order=8, leaf_size=4, box_size=32)
+    assert numpy.max(numpy.abs(A - A_ref)) < 1.0e-10 * numpy.max(numpy.abs(A_ref))
+
+    centers = 20 * numpy.random.rand(10, 2) - 10
+    radii = 0.5 + numpy.random.rand(10)
+    heights = numpy.column_stack([numpy.full(10, 1.0), numpy.full(10, 1.5)])
+    A_ref = sum(
+        mvp.magnetic_dot(X[:, :2] - centers[j], radii[j], heights[j], method="elliptic")
+        for j in range(len(centers))
+    )
+    A = mvp.dots(X, centers, radii, heights, leaf_size=2, box_size=32)
+    assert numpy.max(numpy.abs(A - A_ref)) < 1.0e-4 * numpy.max(numpy.abs(A_ref))
+    return
+
+
+def test_multiple_sources_scaling():
+    # dipole lattice one unit above a 2D sample
+    numpy.random.seed(0)
+    X = mvp._pad(10 * numpy.random.rand(10000, 2))
+    boxes = mvp._Tree(X, 32)
+    sizes = boxes.stop - boxes.start
+
+    def get_work(n):
+        # number of kernel and expansion evaluations, see mvp._sum_boxes
+        x0 = numpy.column_stack([10 * numpy.random.rand(n, 2), numpy.ones(n)])
+        m = numpy.random.rand(n, 3) - 0.5
+        sources = mvp._SourceTree(
+            x0, numpy.zeros(n), numpy.zeros((n, 3, 3)), m, leaf_size=16
+        )
+        theta = 0.1
+        far, near, far_sources, near_sources = mvp._traverse(
+            boxes, sources, theta, theta ** (3.0 / 6)
+        )
+        return (
+            6 ** 2 * (far.shape[1] + far_sources.shape[1])
+            + numpy.sum(sizes[near[0]])
+            + numpy.sum(sizes[near_sources[0]])
+        )
+
+    # 16 times the sources cost less than 8 times the work, and far less
+    # than the direct summation.
+    work = [get_work(1000), get_work(16000)]
+    assert work[1] < 8 * work[0]
+    assert work[1] < 0.2 * len(X) * 16000
+    return
+
+
+_num_calls = 0
+
+
+def _counting_dipole(X, x0, m, scale=1.0):
+    global _num_calls
+    _num_calls += 1
+    return scale * mvp.magnetic_dipole(X, x0, m)
+
+
+def test_cache(tmpdir):
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, "cubesmall.e")
+    mesh, _, _, _ = meshplex.read(filename)
+    X = mesh.node_coords
+    x0 = numpy.array([0.0, 0.0, 10.0])
+    m = numpy.array([0.0, 0.0, 1.0])
+
+    cache = mvp.Cache(str(tmpdir))
+    A0 = cache(_counting_dipole, X, x0, m)
+    assert _num_calls == 1
+    assert isinstance(A0, numpy.memmap)
+
+    # Equivalent calls are hits.
+    for A1 in [
+        cache(_counting_dipole, X, x0, m),
+        cache(_counting_dipole, X, x0, m=m),
+        cache(_counting_dipole, X, m=m, x0=x0, scale=1.0),
+        cache(functools.partial(_counting_dipole, m=m), X, x0),
+        cache(functools.partial(_counting_dipole, x0=x0, m=m, scale=1.0), X),
+    ]:
+        assert isinstance(A1, numpy.memmap)
+        assert numpy.all(A0 == A1)
+    assert _num_calls == 1
+    cache(_counting_dipole, X, x0, m, scale=2.0)
+    assert _num_calls == 2
+
+    # Another instance (e.g., in another process) shares the directory.
+    A2 = mvp.Cache(str(tmpdir))(_counting_dipole, X, x0, 2 * m)
+    assert _num_calls == 3
+    assert numpy.all(A2 == 2 * A0)
+
+    # Only the most recently used potential fits into the cache.
+    file_size = os.path.getsize(str(tmpdir.listdir()[0]))
+    cache = mvp.Cache(str(tmpdir), max_size=file_size + file_size // 2)
+    cache(_counting_dipole, X, x0, 3 * m)
+    assert len(tmpdir.listdir()) == 1
+    cache(_counting_dipole, X, x0, 3 * m)
+    assert _num_calls == 4
+    cache.clear()
+    assert len(tmpdir.listdir()) == 0
+    return
+
+
 if __name__ == "__main__":
     test_pacman()
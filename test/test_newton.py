@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import weakref
+
+import krypy
+import meshplex
+import numpy
+import pytest
+
+from pynosh import magnetic_vector_potentials as mvp
+from pynosh import modelevaluator_nls
+from pynosh import numerical_methods as nm
+
+
+def _get_problem(filename="rectanglesmall.e", **kwargs):
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, filename)
+    mesh, point_data, field_data, _ = meshplex.read(filename)
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh, V=point_data["V"], A=point_data["A"], **kwargs
+    )
+    psi0 = point_data["psi"][:, 0] + 1j * point_data["psi"][:, 1]
+    return modeleval, psi0.reshape(-1, 1)
+
+
+def test_callback():
+    modeleval, psi0 = _get_problem()
+
+    steps = []
+
+    def callback(info):
+        steps.append(info)
+        return False
+
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        callback=callback,
+    )
+    assert out["info"] == 0
+    assert out["stop reason"] == "converged"
+    assert len(steps) == len(out["Newton residuals"]) - 1
+    for info, Fx_norm in zip(steps, out["Newton residuals"][1:]):
+        assert info["Fx_norm"] == Fx_norm
+        assert info["num_linear_iter"] > 0
+    return
+
+
+def test_callback_stop():
+    modeleval, psi0 = _get_problem()
+
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        callback=lambda info: True,
+    )
+    assert out["stop reason"] == "callback"
+    assert len(out["Newton residuals"]) == 2
+
+    num_matvecs = []
+
+    def linear_callback(info):
+        num_matvecs.append(info["num_matvecs"])
+        return info["num_matvecs"] >= 3
+
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        linear_callback=linear_callback,
+    )
+    assert out["info"] == 1
+    assert out["stop reason"] == "linear callback"
+    assert num_matvecs == [1, 2, 3]
+    assert numpy.all(out["x"] == psi0)
+    return
+
+
+@pytest.mark.parametrize("globalization", [None, "line search", "dogleg"])
+def test_globalization(globalization):
+    modeleval, psi0 = _get_problem()
+
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        globalization=globalization,
+    )
+    assert out["info"] == 0
+    assert len(out["step lengths"]) == len(out["Newton residuals"]) - 1
+    for t in out["step lengths"]:
+        assert 0.0 < t <= 1.0
+    return
+
+
+def test_line_search_nan():
+    # A non-finite trial residual shrinks the step instead of looping forever.
+    x = numpy.ones(3)
+    x_new, _, _, info = nm.LineSearch().step(
+        x,
+        numpy.full(3, numpy.nan),
+        x,
+        numpy.sqrt(3.0),
+        1.0e-1,
+        None,
+        lambda y: y,
+        lambda a, b: numpy.vdot(a, b).real,
+    )
+    assert info["step_length"] == 0.0
+    assert numpy.all(x_new == x)
+    return
+
+
+def test_anderson():
+    modeleval, psi0 = _get_problem(preconditioner_type="exact")
+
+    out = nm.anderson(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        switch_tol=1.0e-3,
+    )
+    assert out["info"] == 0
+    # The fixed-point iteration gets below the switching tolerance by itself,
+    # and Newton's method takes over from there.
+    fixed_point_residuals = out["fixed-point residuals"]
+    assert len(fixed_point_residuals) > 2
+    assert fixed_point_residuals[-1] < 1.0e-3 < fixed_point_residuals[0]
+    assert out["Newton residuals"][0] == pytest.approx(fixed_point_residuals[-1])
+    assert out["Newton residuals"][-1] < 1.0e-10
+
+    # If the fixed-point iteration converges all the way, the output looks
+    # like that of a Newton run without any steps.
+    newton_out = out
+    out = nm.anderson(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        nonlinear_tol=1.0e-6,
+        switch_tol=1.0e-6,
+    )
+    assert out["info"] == 0
+    assert set(out) == set(newton_out)
+    assert isinstance(out["Newton residuals"], numpy.ndarray)
+    assert out["Newton residuals"][-1] == out["fixed-point residuals"][-1] < 1.0e-6
+    assert len(out["num linear iterations"]) == 0
+
+    modeleval, psi0 = _get_problem()
+    with pytest.raises(ValueError):
+        nm.anderson(psi0, modeleval, compute_f_extra_args={"mu": 1.0e-2, "g": 1.0})
+    return
+
+
+def _refine(mesh):
+    """Splits each triangle into four.
+    """
+    cells = mesh.cells["nodes"]
+    edges = numpy.concatenate([cells[:, [0, 1]], cells[:, [1, 2]], cells[:, [2, 0]]])
+    edges, idx = numpy.unique(numpy.sort(edges, axis=1), axis=0, return_inverse=True)
+    midpoints = 0.5 * (mesh.node_coords[edges[:, 0]] + mesh.node_coords[edges[:, 1]])
+    a, b, c = cells.T
+    ab, bc, ca = len(mesh.node_coords) + idx.reshape(3, -1)
+    cells = numpy.concatenate(
+        [
+            numpy.column_stack([a, ab, ca]),
+            numpy.column_stack([ab, b, bc]),
+            numpy.column_stack([ca, bc, c]),
+            numpy.column_stack([ab, bc, ca]),
+        ]
+    )
+    return meshplex.MeshTri(numpy.concatenate([mesh.node_coords, midpoints]), cells)
+
+
+def test_nested_iteration():
+    modeleval, psi0 = _get_problem()
+    # rectangle with 25 and 81 nodes
+    meshes = [_refine(_refine(modeleval.mesh))]
+    meshes.append(_refine(meshes[0]))
+    psi0 = nm._interpolate(modeleval.mesh.node_coords, meshes[0].node_coords, psi0)
+    B = numpy.array([0.0, 0.0, 1.0])
+    model_evaluators = [
+        modelevaluator_nls.NlsModelEvaluator(
+            mesh,
+            V=-numpy.ones(len(mesh.node_coords)),
+            A=mvp.constant_field(mesh.node_coords, B),
+            preconditioner_type="exact",
+        )
+        for mesh in meshes
+    ]
+    args = {"mu": 0.5, "g": 1.0}
+    newton_kwargs = {"eta0": 1.0e-6}
+
+    nested = nm.NestedIteration(model_evaluators, **newton_kwargs)
+    out = nested.solve(psi0, compute_f_extra_args=args)
+    assert out["info"] == 0
+    assert out["x"].shape == (len(meshes[1].node_coords), 1)
+    levels = out["levels"]
+    assert [level["num_nodes"] for level in levels] == [
+        len(mesh.node_coords) for mesh in meshes
+    ]
+    # The interpolated coarse solution is a much better initial guess on the
+    # fine level than the interpolated initial guess.
+    cold = nm.newton(
+        nm._interpolate(meshes[0].node_coords, meshes[1].node_coords, psi0),
+        model_evaluators[1],
+        compute_f_extra_args=args,
+        **newton_kwargs
+    )
+    assert cold["info"] == 0
+    num_steps = len(levels[1]["Newton residuals"]) - 1
+    assert num_steps <= len(cold["Newton residuals"]) - 1 - 2
+
+    # The coarse solution is cached now, but only for this initial guess.
+    out = nested.solve(psi0, compute_f_extra_args=args)
+    assert out["info"] == 0
+    assert len(out["levels"]) == 1
+    out = nested.solve(0.5 * psi0, compute_f_extra_args=args)
+    assert len(out["levels"]) == 2
+
+    # Arrays (e.g., potentials) are keyed by their contents.
+    key = nm._get_cache_key(numpy.array([1.0, 2.0]))
+    hash(key)
+    assert nm._get_cache_key(numpy.array([1.0, 2.0])) == key
+    assert nm._get_cache_key(numpy.array([1.0, 3.0])) != key
+    assert nm._get_cache_key(numpy.array([1, 2])) != key
+
+    # The result of a failed run is still the one on the finest level.
+    nested = nm.NestedIteration(model_evaluators, newton_maxiter=1, **newton_kwargs)
+    out = nested.solve(psi0, compute_f_extra_args=args)
+    assert out["info"] != 0
+    assert [level["info"] for level in out["levels"]] == [1, 1]
+    assert out["x"].shape == (len(meshes[1].node_coords), 1)
+    return
+
+
+def test_deflation():
+    modeleval, psi0 = _get_problem()
+    args = {"mu": 1.0e-2, "g": 1.0}
+
+    # From a small initial guess, Newton's method finds the trivial state.
+    out0 = nm.newton(0.1 * psi0, modeleval, compute_f_extra_args=args)
+    assert out0["info"] == 0
+    x0 = out0["x"]
+    assert numpy.sqrt(modeleval.inner_product(x0, x0)[0, 0].real) < 1.0e-10
+
+    out1 = nm.newton(
+        0.1 * psi0,
+        modeleval,
+        compute_f_extra_args=args,
+        newton_maxiter=50,
+        deflation=[x0],
+    )
+    assert out1["info"] == 0
+
+    # Make sure we didn't find the same state (modulo phase) again.
+    x1 = out1["x"]
+    alpha = modeleval.inner_product(x0, x1)[0, 0].real
+    beta = modeleval.inner_product(1j * x0, x1)[0, 0].real
+    dist2 = (
+        modeleval.inner_product(x0, x0)[0, 0].real
+        + modeleval.inner_product(x1, x1)[0, 0].real
+        - 2 * numpy.sqrt(alpha ** 2 + beta ** 2)
+    )
+    assert dist2 > 1.0e-5
+    return
+
+
+def test_divergence_detector():
+    detector = nm.DivergenceDetector(window=3, min_reduction=0.5, max_growth=1.0e3)
+    detector.begin(numpy.ones(10))
+    x = numpy.ones(10)
+
+    assert detector.check([1.0, 0.1, 0.01, 0.001], x, 0) is None
+    assert detector.check([1.0, 0.9, 0.8, 0.7], x, 0) == "divergence: stagnation"
+    assert detector.check([1.0, 0.1, 1.0e3], x, 0) == "divergence: residual growth"
+    assert detector.check([1.0, 0.1], x, 2) == "divergence: Krylov failures"
+    assert detector.check([1.0, 0.1], 100 * x, 0) == "divergence: state blow-up"
+
+    # A regular run isn't affected.
+    modeleval, psi0 = _get_problem()
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        divergence_detector=nm.DivergenceDetector(),
+    )
+    assert out["info"] == 0
+    return
+
+
+def test_scaled():
+    modeleval, psi0 = _get_problem()
+    args = {"mu": 1.0e-2, "g": 1.0}
+
+    scaled = modeleval.get_scaled()
+    y = scaled.scale(psi0)
+    assert numpy.all(abs(scaled.unscale(y) - psi0) < 1.0e-14)
+    # The scaled residual has the same norm.
+    Fx = modeleval.compute_f(psi0, **args)
+    Fy = scaled.compute_f(y, **args)
+    assert (
+        abs(
+            numpy.sqrt(modeleval.inner_product(Fx, Fx)[0, 0])
+            - numpy.sqrt(scaled.inner_product(Fy, Fy)[0, 0])
+        )
+        < 1.0e-12
+    )
+
+    out0 = nm.newton(psi0, modeleval, compute_f_extra_args=args)
+    out1 = nm.newton(psi0, modeleval, compute_f_extra_args=args, scaled=True)
+    assert out1["info"] == 0
+    assert len(out0["Newton residuals"]) == len(out1["Newton residuals"])
+    diff = out0["x"] - out1["x"]
+    assert numpy.sqrt(modeleval.inner_product(diff, diff)[0, 0]) < 1.0e-8
+    return
+
+
+@pytest.mark.parametrize(
+    "preconditioner_type, num_amg_cycles", [("none", numpy.inf), ("cycles", 1)]
+)
+def test_single_precision(preconditioner_type, num_amg_cycles):
+    modeleval, psi0 = _get_problem(
+        preconditioner_type=preconditioner_type, num_amg_cycles=num_amg_cycles
+    )
+    args = {"mu": 1.0e-2, "g": 1.0}
+
+    J = modeleval.get_jacobian(psi0, dtype=numpy.complex64, **args)
+    phi = numpy.ones(psi0.shape, dtype=numpy.complex64)
+    assert (J * phi).dtype == numpy.complex64
+    if preconditioner_type != "none":
+        Minv = modeleval.get_preconditioner_inverse(psi0, dtype=numpy.complex64, **args)
+        Minv_double = modeleval.get_preconditioner_inverse(psi0, **args)
+        y = Minv * phi
+        y_double = Minv_double * phi.astype(complex)
+        assert y.dtype == numpy.complex64
+        assert numpy.linalg.norm(y - y_double) < 1.0e-5 * numpy.linalg.norm(y_double)
+
+    precisions = []
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args=args,
+        forcing_term=nm.Forcing_EW1(),
+        eta0=1.0e-1,
+        single_precision_eta=1.0e-4,
+        callback=lambda info: precisions.append(info["linear_precision"]),
+    )
+    assert out["info"] == 0
+    assert out["x"].dtype == psi0.dtype
+    assert precisions[0] == "single"
+    return
+
+
+def test_quasi_newton():
+    modeleval, psi0 = _get_problem()
+
+    quasi_newton = nm.QuasiNewton()
+    updates = []
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        newton_maxiter=30,
+        quasi_newton=quasi_newton,
+        callback=lambda info: updates.append(info["quasi_newton_updates"]),
+    )
+    assert out["info"] == 0
+    assert updates[0] == 0
+    assert quasi_newton.num_refreshes == updates.count(0)
+    assert quasi_newton.num_refreshes < len(updates)
+    return
+
+
+def test_adaptive_forcing():
+    modeleval, psi0 = _get_problem()
+
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        forcing_term="adaptive",
+    )
+    assert out["info"] == 0
+    assert len(out["forcing terms"]) == len(out["Newton residuals"]) - 1
+    assert len(out["forcing choices"]) == len(out["forcing terms"])
+    for choice, eta in zip(out["forcing choices"], out["forcing terms"]):
+        assert choice["eta"] == eta
+        assert 1.0e-10 <= eta <= 1.0e-1
+    return
+
+
+def test_history():
+    modeleval, psi0 = _get_problem(preconditioner_type="exact")
+
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        max_linear_histories=2,
+        trace_memory=True,
+    )
+    assert out["info"] == 0
+    num_steps = len(out["Newton residuals"]) - 1
+    assert num_steps > 2
+    assert len(out["linear relresvecs"]) == 2
+    assert len(out["num linear iterations"]) == num_steps
+    assert out["num linear iterations"][-1] == len(out["linear relresvecs"][-1]) - 1
+    assert isinstance(out["Newton residuals"], numpy.ndarray)
+
+    # Each step allocates at least the new state and its residual, and it
+    # sets up its own Jacobian and AMG preconditioner. Nothing from the
+    # previous steps is kept alive on top of that, so the later steps need
+    # about as much as the first one (which also pays for one-time
+    # allocations) and don't get more expensive as the iteration goes on.
+    peak_memory = out["peak memory"]
+    assert len(peak_memory) == num_steps
+    assert numpy.all(peak_memory > 2 * psi0.nbytes)
+    assert numpy.all(peak_memory[1:] <= 2 * peak_memory[0])
+    assert numpy.all(peak_memory[2:] <= 2 * peak_memory[1])
+    return
+
+
+def test_release_last_solver():
+    modeleval, psi0 = _get_problem(preconditioner_type="exact")
+
+    class RecordingMinres(krypy.recycling.RecyclingMinres):
+        preconditioners = []
+        num_alive = []
+
+        def solve(self, linear_system, *args, **kwargs):
+            # the preconditioners of the previous steps must be gone by now
+            self.num_alive.append(
+                sum(ref() is not None for ref in self.preconditioners)
+            )
+            self.preconditioners.append(weakref.ref(linear_system.M))
+            return super(RecordingMinres, self).solve(linear_system, *args, **kwargs)
+
+    out = nm.newton(
+        psi0,
+        modeleval,
+        compute_f_extra_args={"mu": 1.0e-2, "g": 1.0},
+        RecyclingSolver=RecordingMinres,
+    )
+    assert out["info"] == 0
+    assert len(RecordingMinres.num_alive) > 2
+    assert all(n == 0 for n in RecordingMinres.num_alive)
+    assert out["recycling_solver"].last_solver.linear_system.M is not None
+    return
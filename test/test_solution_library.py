@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+import os
+
+import meshplex
+import numpy
+import pytest
+
+from pynosh import modelevaluator_nls
+from pynosh.solution_library import SolutionLibrary
+
+
+@pytest.mark.parametrize("filename", ["rectanglesmall.e", "pacman.e", "cubesmall.e"])
+def test(filename):
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, filename)
+    mesh, point_data, field_data, _ = meshplex.read(filename)
+
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh, V=point_data["V"], A=point_data["A"]
+    )
+    psi = point_data["psi"][:, 0] + 1j * point_data["psi"][:, 1]
+
+    library = SolutionLibrary(modeleval)
+    assert library.find(psi) is None
+    assert library.add(psi) == 0
+
+    # The fingerprint is gauge-invariant, and the library recognizes the state
+    # with another phase.
+    psi2 = numpy.exp(0.7j) * psi
+    assert numpy.all(
+        abs(library.fingerprint(psi2) - library.fingerprint(psi)) < 1.0e-12
+    )
+    assert library.find(psi2) == 0
+
+    # A different state isn't found.
+    x = mesh.node_coords[:, 0]
+    assert library.find(psi * numpy.exp(1j * x)) is None
+    assert library.find(0.5 * psi) is None
+    assert library.add(0.5 * psi) == 1
+    assert library.find(0.5 * psi2) == 1
+    assert len(library) == 2
+    return
+
+
+def test_perturbed_symmetric_state():
+    this_path = os.path.dirname(os.path.realpath(__file__))
+    filename = os.path.join(this_path, "rectanglesmall.e")
+    mesh, point_data, field_data, _ = meshplex.read(filename)
+    modeleval = modelevaluator_nls.NlsModelEvaluator(
+        mesh, V=point_data["V"], A=point_data["A"]
+    )
+
+    # The moments of a symmetric state are (close to) 0, and so are their
+    # differences to a slightly perturbed copy.
+    x = mesh.node_coords - numpy.mean(mesh.node_coords, axis=0)
+    psi = numpy.exp(-numpy.sum(x ** 2, axis=1)) + 0j
+    library = SolutionLibrary(modeleval)
+    library.add(psi)
+
+    numpy.random.seed(0)
+    n = len(psi)
+    phi = psi + 1.0e-9 * (numpy.random.rand(n) + 1j * numpy.random.rand(n))
+    assert library.find(numpy.exp(0.3j) * phi) == 0
+    assert library.find(psi + 1.0e-3 * numpy.random.rand(n)) is None
+    return
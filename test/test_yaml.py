@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+import gc
+import io
+import threading
+
+import numpy
+
+from pynosh import yaml
+
+
+def test_emitter():
+    stream = io.StringIO()
+    emitter = yaml.YamlEmitter(stream, buffer_size=16)
+    emitter.begin_doc()
+    emitter.begin_seq()
+    emitter.add_comment("Newton step 1")
+    emitter.begin_map()
+    emitter.add_key_value("Fx_norm", numpy.float64(0.5))
+    emitter.add_key_value("relresvec", numpy.linspace(1.0, 0.0, 2000))
+    emitter.end_map()
+    emitter.end_seq()
+    emitter.flush()
+
+    lines = stream.getvalue().split("\n")
+    assert lines[:3] == ["---", "# Newton step 1", "- 'Fx_norm': 0.5"]
+    # no abbreviation of large arrays
+    relresvec = lines[3].split(": ", 1)[1]
+    assert "..." not in relresvec
+    values = numpy.array([float(v) for v in relresvec.strip("[]").split(",")])
+    assert numpy.all(values == numpy.linspace(1.0, 0.0, 2000))
+
+    emitter.close()
+    emitter.add_comment("done")
+    emitter.flush()
+    assert stream.getvalue().endswith("# done\n")
+    return
+
+
+def test_emitter_flush():
+    stream = io.StringIO()
+    emitter = yaml.YamlEmitter(stream)
+    emitter.begin_doc()
+    emitter.begin_map()
+    emitter.add_key_value("mu", 1.0)
+    assert stream.getvalue() == ""
+    # The end of the top-level map flushes.
+    emitter.end_map()
+    assert stream.getvalue() == "---\n'mu': 1.0\n"
+
+    # All emitters share one writer thread, and those that aren't closed
+    # are flushed when they're collected.
+    num_threads = threading.active_count()
+    streams = [io.StringIO() for _ in range(10)]
+    for k, stream in enumerate(streams):
+        emitter = yaml.YamlEmitter(stream)
+        emitter.add_comment("emitter %d" % k)
+    assert threading.active_count() == num_threads
+    del emitter
+    gc.collect()
+    yaml._get_writer().queue.join()
+    for k, stream in enumerate(streams):
+        assert stream.getvalue() == "# emitter %d\n" % k
+    return
+
+
+class _BlockingStream(io.StringIO):
+    def __init__(self):
+        super(_BlockingStream, self).__init__()
+        self.release = threading.Event()
+        return
+
+    def write(self, text):
+        self.release.wait()
+        return super(_BlockingStream, self).write(text)
+
+
+def test_emitter_flush_independent():
+    # An emitter doesn't wait for the output that other emitters hand over
+    # to the writer thread after its own.
+    stream = io.StringIO()
+    emitter = yaml.YamlEmitter(stream, buffer_size=0)
+    emitter.add_comment("fast")
+    slow_stream = _BlockingStream()
+    slow = yaml.YamlEmitter(slow_stream, buffer_size=0)
+    slow.add_comment("slow")
+
+    flushed = threading.Event()
+    thread = threading.Thread(target=lambda: (emitter.flush(), flushed.set()))
+    thread.daemon = True
+    thread.start()
+    is_flushed = flushed.wait(5.0)
+    slow_stream.release.set()
+    assert is_flushed
+    assert stream.getvalue() == "# fast\n"
+
+    slow.flush()
+    assert slow_stream.getvalue() == "# slow\n"
+    thread.join()
+    return
+
+
+def test_format():
+    assert yaml._format(numpy.array(0.5)) == "0.5"
+    assert yaml._format(numpy.array([0.1, 2.0])) == "[0.1, 2.0]"
+    assert yaml._format(numpy.arange(4).reshape(2, 2)) == "[[0, 1], [2, 3]]"
+    assert yaml._format(numpy.zeros((2, 1, 0))) == "[[[]], [[]]]"
+    assert yaml._format([numpy.arange(2), 1.5]) == "[[0, 1], 1.5]"
+    return
@@ -9,6 +9,7 @@ import krypy
 
 import pynosh.numerical_methods as nm
 import pynosh.modelevaluator_nls as gm
+from pynosh.solution_library import SolutionLibrary
 
 
 def _main():
@@ -25,22 +26,108 @@ def _main():
     A = 0.5 * np.column_stack([-X[1], X[0], np.zeros(n)])
     point_data = {"V": -np.ones(n), "A": A}
 
-    # build the model evaluator
-    modeleval = gm.NlsModelEvaluator(mesh, V=point_data["V"], A=point_data["A"])
-
     mu_range = np.linspace(args.mu_range[0], args.mu_range[1], args.num_parameter_steps)
     print("Looking for solutions for mu in")
     print(mu_range)
     print()
-    find_beautiful_states(modeleval, mu_range, args.forcing_term)
+    find_beautiful_states(
+        mesh, point_data, mu_range, args.forcing_term, num_processes=args.num_processes
+    )
+    return
+
+
+def _get_initial_guess(node_coords, alpha, k):
+    """cos-product initial guess for Newton.
+    """
+    if len(k) == 2:
+        psi0 = (
+            alpha
+            * np.cos(k[0] * np.pi * node_coords[:, 0])
+            * np.cos(k[1] * np.pi * node_coords[:, 1])
+            + 1j * 0
+        )
+    elif len(k) == 3:
+        psi0 = (
+            alpha
+            * np.cos(k[0] * np.pi * node_coords[:, 0])
+            * np.cos(k[1] * np.pi * node_coords[:, 1])
+            * np.cos(k[2] * np.pi * node_coords[:, 2])
+            + 1j * 0
+        )
+    else:
+        raise RuntimeError("Illegal k.")
+    return psi0
+
+
+# State of the Newton runs. It's set up in the parent process before the
+# worker processes are forked, so they share it (mesh, potentials, KEO).
+_shared = {}
+
+
+def _solve_candidate(task):
+    """Runs Newton for one (alpha, k) candidate.
+    """
+    index, alpha, k = task
+    modeleval = _shared["modeleval"]
+    psi0 = _get_initial_guess(modeleval.mesh.node_coords, alpha, k)
+    try:
+        newton_out = nm.newton(
+            psi0[:, None],
+            modeleval,
+            nonlinear_tol=1.0e-10,
+            newton_maxiter=50,
+            compute_f_extra_args={"mu": _shared["mu"], "g": 1.0},
+            eta0=1.0e-10,
+            forcing_term=_shared["forcing_term"],
+            # Steer Newton away from the states we already have.
+            deflation=_shared["found_states"],
+            # Don't waste time on runs that won't converge anyway.
+            divergence_detector=nm.DivergenceDetector(),
+        )
+    except krypy.utils.ConvergenceError:
+        return index, alpha, k, psi0, None
+    # The recycling solver holds references to all linear systems; don't
+    # send it back to the parent process.
+    del newton_out["recycling_solver"]
+    return index, alpha, k, psi0, newton_out
+
+
+def _in_order(results):
+    """Yields the results (tuples starting with the task index) in the order
+    of the tasks, holding back those that finish early.
+    """
+    early = {}
+    next_index = 0
+    for result in results:
+        early[result[0]] = result
+        while next_index in early:
+            yield early.pop(next_index)
+            next_index += 1
     return
 
 
-def find_beautiful_states(modeleval, mu_range, forcing_term, save_doubles=True):
+def find_beautiful_states(
+    mesh, potential, mu_range, forcing_term, save_doubles=True, num_processes=1
+):
     """Loop through a set of parameters/initial states and try to find
     starting points that (quickly) lead to "interesting looking" solutions.
     Such solutions are filtered out only by their energy at the moment.
+
+    `potential` holds the keyword arguments `V` and `A` of
+    :class:`pynosh.modelevaluator_nls.NlsModelEvaluator`; the nodal ones are
+    stored along with the solutions.
+
+    With `num_processes` > 1, the Newton runs for one mu are handed out to
+    a pool of worker processes one candidate at a time, and the results are
+    processed as they come in, in the order of the search space such that
+    the output file names are deterministic. The workers are forked after
+    the KEO for mu is assembled, so they share it along with the mesh
+    (this needs the fork start method, i.e., a POSIX system). Unlike in the
+    serial search, the candidates don't deflate the states found by the
+    others; states found more than once are recognized when the results are
+    processed.
     """
+    import multiprocessing
 
     # Define search space.
     # Don't use Mu=0 as the preconditioner is singular for mu=0, psi=0.
@@ -49,124 +136,138 @@ def find_beautiful_states(modeleval, mu_range, forcing_term, save_doubles=True):
 
     # Compile the search space.
     # If all nodes sit in x-y-plane, the frequency loop in z-direction can be omitted.
-    if modeleval.mesh.node_coords.shape[1] == 2 or np.all(np.abs(modeleval.mesh.node_coords[:, 2]) < 1.0e-13):
+    if mesh.node_coords.shape[1] == 2 or np.all(
+        np.abs(mesh.node_coords[:, 2]) < 1.0e-13
+    ):
         search_space_k = [(a, b) for a in Frequencies for b in Frequencies]
-    elif modeleval.mesh.node_coords.shape[1] == 3:
+    elif mesh.node_coords.shape[1] == 3:
         search_space_k = [
             (a, b, c) for a in Frequencies for b in Frequencies for c in Frequencies
         ]
     search_space = [(a, k) for a in reversed(Alpha) for k in search_space_k]
+    tasks = [(i, alpha, k) for i, (alpha, k) in enumerate(search_space)]
+
+    modeleval = gm.NlsModelEvaluator(mesh, **potential)
+    _shared["modeleval"] = modeleval
+    _shared["forcing_term"] = forcing_term
 
     solution_id = 0
     for mu in mu_range:
         # Reset the solutions each time the problem parameters change.
-        found_solutions = []
-        # Loop over initial states.
-        for alpha, k in search_space:
-            print("mu = {}; alpha = {}; k = {}".format(mu, alpha, k))
-            # Set the intitial guess for Newton.
-            if len(k) == 2:
-                psi0 = (
-                    alpha
-                    * np.cos(k[0] * np.pi * modeleval.mesh.node_coords[:, 0])
-                    * np.cos(k[1] * np.pi * modeleval.mesh.node_coords[:, 1])
-                    + 1j * 0
-                )
-            elif len(k) == 3:
-                psi0 = (
-                    alpha
-                    * np.cos(k[0] * np.pi * modeleval.mesh.node_coords[:, 0])
-                    * np.cos(k[1] * np.pi * modeleval.mesh.node_coords[:, 1])
-                    * np.cos(k[2] * np.pi * modeleval.mesh.node_coords[:, 2])
-                    + 1j * 0
-                )
-            else:
-                raise RuntimeError("Illegal k.")
-
-            print("Performing Newton iteration...")
-            linsolve_maxiter = 500  # 2*len(psi0)
-            try:
-                newton_out = nm.newton(
-                    psi0[:, None],
+        found_solutions = SolutionLibrary(modeleval)
+        _shared["mu"] = mu
+        # Assemble the KEO before forking.
+        modeleval._get_keo(mu)
+        if num_processes > 1:
+            _shared["found_states"] = []
+            pool = multiprocessing.get_context("fork").Pool(num_processes)
+            results = pool.imap_unordered(_solve_candidate, tasks)
+        else:
+            pool = None
+            _shared["found_states"] = found_solutions.states
+            results = map(_solve_candidate, tasks)
+        try:
+            for _, alpha, k, psi0, newton_out in _in_order(results):
+                solution_id = _process_result(
                     modeleval,
-                    nonlinear_tol=1.0e-10,
-                    newton_maxiter=50,
-                    compute_f_extra_args={"mu": mu, "g": 1.0},
-                    eta0=1.0e-10,
-                    forcing_term=forcing_term,
+                    potential,
+                    mu,
+                    alpha,
+                    k,
+                    psi0,
+                    newton_out,
+                    found_solutions,
+                    solution_id,
+                    save_doubles,
                 )
-            except krypy.utils.ConvergenceError:
-                print("Krylov convergence failure. Skip.\n")
-                continue
-            print(" done.")
-
-            num_krylov_iters = [
-                len(resvec) for resvec in newton_out["linear relresvecs"]
-            ]
-            print("Num Krylov iterations:", num_krylov_iters)
-            print("Newton residuals:", newton_out["Newton residuals"])
-            if newton_out["info"] == 0:
-                num_newton_iters = len(newton_out["linear relresvecs"])
-                psi = newton_out["x"]
-                # Use the energy as a measure for ruling out boring states such as
-                # psi==0 or psi==1 overall.
-                energy = modeleval.energy(psi)
-                print("Energy of solution state: %g." % energy)
-                if energy > -0.999 and energy < -0.001:
-                    # Store the file as VTU such that ParaView can loop through and
-                    # display them at once. For this, also be sure to keep the file name
-                    # in the format 'interesting<-krylovfails03>-01414.vtu'.
-                    filename = "interesting-"
-                    num_krylov_fails = num_krylov_iters.count(linsolve_maxiter)
-                    if num_krylov_fails > 0:
-                        filename += "krylovfails{:02d}-".format(num_krylov_fails)
-                    filename += "{:02d}{:03d}.vtu".format(num_newton_iters, solution_id)
-                    print("Interesting state found for mu={}!".format(mu))
-                    # Check if we already stored that one.
-                    already_found = False
-                    for state in found_solutions:
-                        # Synchronize the complex argument.
-                        state *= np.exp(1j * (np.angle(psi[0]) - np.angle(state[0])))
-                        diff = psi - state
-                        if modeleval.inner_product(diff, diff) < 1.0e-10:
-                            already_found = True
-                            break
-                    if already_found and not save_doubles:
-                        print("-- But we already have that one.")
-                    else:
-                        found_solutions.append(psi)
-                        print("Storing in {}.".format(filename))
-                        # if len(k) == 2:
-                        #     function_string = (
-                        #         "psi0(X) = %g * cos(%g*pi*x) * cos(%g*pi*y)"
-                        #         % (alpha, k[0], k[1])
-                        #     )
-                        # elif len(k) == 3:
-                        #     function_string = (
-                        #         "psi0(X) = %g * cos(%g*pi*x) * cos(%g*pi*y) * cos(%g*pi*z)"
-                        #         % (alpha, k[0], k[1], k[2])
-                        #     )
-                        # else:
-                        #     raise RuntimeError("Illegal k.")
-                        modeleval.mesh.write(
-                            filename,
-                            point_data={
-                                "psi": np.column_stack([psi.real, psi.imag]),
-                                "psi0": np.column_stack([psi0.real, psi0.imag]),
-                                "V": modeleval._V,
-                                "A": modeleval._raw_magnetic_vector_potential,
-                            },
-                            field_data={
-                                "g": np.array(1.0),
-                                "mu": np.array(mu),
-                                # "psi0(X)": function_string,
-                            },
-                        )
-                        solution_id += 1
-            print()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
     return
 
 
+def _process_result(
+    modeleval,
+    potential,
+    mu,
+    alpha,
+    k,
+    psi0,
+    newton_out,
+    found_solutions,
+    solution_id,
+    save_doubles,
+):
+    """Check a Newton result and store it if it's interesting.
+    """
+    print("mu = {}; alpha = {}; k = {}".format(mu, alpha, k))
+    if newton_out is None:
+        print("Krylov convergence failure. Skip.\n")
+        return solution_id
+
+    linsolve_maxiter = 500  # 2*len(psi0)
+    num_krylov_iters = [len(resvec) for resvec in newton_out["linear relresvecs"]]
+    print("Num Krylov iterations:", num_krylov_iters)
+    print("Newton residuals:", newton_out["Newton residuals"])
+    if newton_out["info"] == 0:
+        num_newton_iters = len(newton_out["linear relresvecs"])
+        psi = newton_out["x"]
+        # Use the energy as a measure for ruling out boring states such as
+        # psi==0 or psi==1 overall.
+        energy = modeleval.energy(psi)
+        print("Energy of solution state: %g." % energy)
+        if energy > -0.999 and energy < -0.001:
+            # Store the file as VTU such that ParaView can loop through and
+            # display them at once. For this, also be sure to keep the file name
+            # in the format 'interesting<-krylovfails03>-01414.vtu'.
+            filename = "interesting-"
+            num_krylov_fails = num_krylov_iters.count(linsolve_maxiter)
+            if num_krylov_fails > 0:
+                filename += "krylovfails{:02d}-".format(num_krylov_fails)
+            filename += "{:02d}{:03d}.vtu".format(num_newton_iters, solution_id)
+            print("Interesting state found for mu={}!".format(mu))
+            # Check if we already stored that one.
+            already_found = found_solutions.find(psi) is not None
+            if already_found and not save_doubles:
+                print("-- But we already have that one.")
+            else:
+                found_solutions.add(psi)
+                print("Storing in {}.".format(filename))
+                # if len(k) == 2:
+                #     function_string = (
+                #         "psi0(X) = %g * cos(%g*pi*x) * cos(%g*pi*y)"
+                #         % (alpha, k[0], k[1])
+                #     )
+                # elif len(k) == 3:
+                #     function_string = (
+                #         "psi0(X) = %g * cos(%g*pi*x) * cos(%g*pi*y) * cos(%g*pi*z)"
+                #         % (alpha, k[0], k[1], k[2])
+                #     )
+                # else:
+                #     raise RuntimeError("Illegal k.")
+                point_data = {
+                    "psi": np.column_stack([psi.real, psi.imag]),
+                    "psi0": np.column_stack([psi0.real, psi0.imag]),
+                }
+                # Callable potentials have no nodal values to store.
+                for key, value in potential.items():
+                    if not callable(value):
+                        point_data[key] = value
+                modeleval.mesh.write(
+                    filename,
+                    point_data=point_data,
+                    field_data={
+                        "g": np.array(1.0),
+                        "mu": np.array(mu),
+                        # "psi0(X)": function_string,
+                    },
+                )
+                solution_id += 1
+    print()
+    return solution_id
+
+
 def _parse_input_arguments():
     """Parse input arguments.
     """
@@ -209,6 +310,15 @@ def _parse_input_arguments():
         type=str,
         help="Forcing term for Newton" "s method",
     )
+
+    parser.add_argument(
+        "--num-processes",
+        "-p",
+        default=1,
+        type=int,
+        help="Number of processes for the initial guess search; consider "
+        "setting OMP_NUM_THREADS=1 (default: 1)",
+    )
     return parser.parse_args()
 
 
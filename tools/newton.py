@@ -21,9 +21,9 @@ def _main():
     ye.begin_doc()
 
     # read the mesh
-    print("# Reading the mesh...")
+    ye.add_comment("Reading the mesh...")
     mesh, point_data, field_data = meshplex.reader.read(args.filename)
-    print("# done.")
+    ye.add_comment("done.")
 
     num_nodes = len(mesh.node_coords)
 
@@ -106,7 +106,8 @@ def _main():
     ye.end_map()
 
     # energy of the state
-    print(("# Energy of the final state: %g." % nls_modeleval.energy(sol)))
+    ye.add_comment("Energy of the final state: %g." % nls_modeleval.energy(sol))
+    ye.close()
 
     if args.solutionfile:
         modeleval.mesh.write(
@@ -167,7 +168,7 @@ def my_newton(args, modeleval, psi0, g, mu, yaml_emitter=None, debug=True):
         vector_factory_generator=vector_factory_generator,
         nonlinear_tol=1.0e-10,
         eta0=args.eta,
-        forcing_term="constant",
+        forcing_term=args.forcing_term,
         compute_f_extra_args={"g": g, "mu": mu},
         debug=debug,
         yaml_emitter=yaml_emitter,
@@ -244,6 +245,15 @@ def _parse_input_arguments():
         help="linear solver tolerance (default: 1e-10)",
     )
 
+    parser.add_argument(
+        "--forcing-term",
+        "-f",
+        choices=["constant", "adaptive"],
+        default="constant",
+        help="linear solver tolerance strategy: constant ETA or adaptive, "
+        "i.e., chosen to minimize the predicted run time (default: constant)",
+    )
+
     parser.add_argument(
         "--resexp",
         "-r",
@@ -440,6 +440,7 @@ ritz_vals, ritz_vecs, norm_ritz_res = nm.get_ritz(W, AW, Vfull, Hfull,
 
     ye.end_seq()
     ye.end_map()
+    ye.close()
     return
 
 